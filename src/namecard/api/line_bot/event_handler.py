@@ -5,7 +5,8 @@
 """
 
 import structlog
-from typing import Optional, Union, TYPE_CHECKING
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Union, TYPE_CHECKING
 
 # LINE SDK v3 imports
 from linebot.v3.messaging import (
@@ -32,7 +33,10 @@ except ImportError:
 from src.namecard.core.services.user_service import user_service
 from src.namecard.core.services.security import security_service, error_handler
 from src.namecard.infrastructure.ai.card_processor import CardProcessor
-from src.namecard.infrastructure.storage.notion_client import NotionClient
+from src.namecard.infrastructure.storage.notion_client import (
+    MAX_CONCURRENT_NOTION_REQUESTS,
+    NotionClient,
+)
 from src.namecard.infrastructure.storage.image_upload_worker import (
     submit_image_upload,
     get_failed_tasks,
@@ -48,6 +52,39 @@ from src.namecard.api.line_bot.flex_templates import (
 
 logger = structlog.get_logger()
 
+# 多張名片並行儲存到 Notion 的最大線程數（與上傳 worker 共用 Notion client 的全進程名額）
+MAX_NOTION_SAVE_WORKERS = MAX_CONCURRENT_NOTION_REQUESTS
+
+# 固定回覆內容與快速回覆選項，於載入時建立一次，各請求共用（不可修改）
+HELP_TEXT = """🎯 名片識別系統
+
+📱 上傳名片照片 → 自動識別存入資料庫
+📦 輸入「批次」→ 批次處理模式
+📊 輸入「狀態」→ 查看進度
+
+⚡ 支援多張名片同時識別
+📋 每日限制：50 張"""
+
+HELP_QUICK_REPLY = QuickReply(
+    items=[
+        QuickReplyItem(action=MessageAction(label="開始批次", text="批次")),
+        QuickReplyItem(action=MessageAction(label="查看狀態", text="狀態")),
+    ]
+)
+
+BATCH_MODE_QUICK_REPLY = QuickReply(
+    items=[
+        QuickReplyItem(action=MessageAction(label="結束批次", text="結束批次")),
+        QuickReplyItem(action=MessageAction(label="查看進度", text="狀態")),
+    ]
+)
+
+UNKNOWN_COMMAND_QUICK_REPLY = QuickReply(
+    items=[
+        QuickReplyItem(action=MessageAction(label="查看說明", text="幫助")),
+    ]
+)
+
 
 class UnifiedEventHandler:
     """統一的事件處理器，處理所有 LINE Bot 訊息
@@ -105,24 +142,10 @@ class UnifiedEventHandler:
             if self.tenant_id:
                 self._save_user_profile(user_id)
 
-            # 命令處理
-            if text in ["help", "說明", "幫助"]:
-                self._send_help_message(reply_token)
-
-            elif text in ["批次", "batch", "批量"]:
-                self._start_batch_mode(user_id, reply_token)
-
-            elif text in ["狀態", "status", "進度"]:
-                self._show_status(user_id, reply_token)
-
-            elif text in ["結束批次", "end batch", "完成批次"]:
-                self._end_batch_mode(user_id, reply_token)
-
-            elif text in ["重試", "retry", "重新上傳"]:
-                self._retry_failed_uploads(user_id, reply_token)
-
-            elif text in ["清除失敗", "clear failed"]:
-                self._clear_failed_uploads(user_id, reply_token)
+            # 命令處理（查表分派，TEXT_COMMANDS 定義於類別之後）
+            command = TEXT_COMMANDS.get(text)
+            if command:
+                command(self, user_id, reply_token)
 
             else:
                 # 未知命令
@@ -257,11 +280,13 @@ class UnifiedEventHandler:
             error_messages = []
             saved_page_ids = []  # 記錄成功儲存的頁面 ID
 
-            for idx, card in enumerate(cards):
+            # 儲存到 Notion（不含圖片），多張名片並行送出，結果依原順序處理
+            save_futures = self._save_cards_to_notion(cards)
+
+            for idx, (card, future) in enumerate(zip(cards, save_futures)):
                 try:
-                    # 儲存到 Notion（不含圖片）- 返回 (page_id, page_url)
-                    logger.warning("DEBUG_NOTION_SAVE_START", card_idx=idx, card_name=card.name, card_company=card.company, notion_db_id=self.notion_client.database_id[:10] + "..." if self.notion_client.database_id else None, data_source_id=self.notion_client.data_source_id[:10] + "..." if self.notion_client.data_source_id else "NONE!")
-                    result = self.notion_client.save_business_card(card)
+                    # 返回 (page_id, page_url)
+                    result = future.result()
                     logger.warning("DEBUG_NOTION_SAVE_RESULT", card_idx=idx, result_is_none=result is None, page_id=result[0][:10] + "..." if result else None)
 
                     if result:
@@ -361,27 +386,48 @@ class UnifiedEventHandler:
             error_msg = error_handler.handle_ai_error(e, user_id)
             self._send_error_message(reply_token, error_msg)
 
-    def _send_help_message(self, reply_token: str) -> None:
-        """發送說明訊息"""
-        help_text = """🎯 名片識別系統
+    def _save_cards_to_notion(self, cards: List) -> List[Future]:
+        """
+        儲存名片到 Notion
 
-📱 上傳名片照片 → 自動識別存入資料庫
-📦 輸入「批次」→ 批次處理模式
-📊 輸入「狀態」→ 查看進度
+        單張名片直接在目前線程儲存；多張名片以線程池並行呼叫
+        save_business_card，將 N 次 Notion 往返的等待時間重疊。
+        同時進行的 Notion 請求數與 429 重試由 NotionClient 統一控制。
 
-⚡ 支援多張名片同時識別
-📋 每日限制：50 張"""
+        Args:
+            cards: 名片列表
 
-        self._send_reply(
-            reply_token,
-            help_text,
-            quick_reply=QuickReply(
-                items=[
-                    QuickReplyItem(action=MessageAction(label="開始批次", text="批次")),
-                    QuickReplyItem(action=MessageAction(label="查看狀態", text="狀態")),
-                ]
-            ),
-        )
+        Returns:
+            與 cards 同順序的 Future 列表，結果為 (page_id, page_url) 或 None，
+            儲存失敗時 Future 帶有例外
+        """
+        for idx, card in enumerate(cards):
+            logger.warning("DEBUG_NOTION_SAVE_START", card_idx=idx, card_name=card.name, card_company=card.company, notion_db_id=self.notion_client.database_id[:10] + "..." if self.notion_client.database_id else None, data_source_id=self.notion_client.data_source_id[:10] + "..." if self.notion_client.data_source_id else "NONE!")
+
+        if len(cards) > 1:
+            with ThreadPoolExecutor(
+                max_workers=min(len(cards), MAX_NOTION_SAVE_WORKERS),
+                thread_name_prefix="NotionSave",
+            ) as executor:
+                return [executor.submit(self.notion_client.save_business_card, card) for card in cards]
+
+        futures = []
+        for card in cards:
+            future = Future()
+            try:
+                future.set_result(self.notion_client.save_business_card(card))
+            except Exception as e:
+                future.set_exception(e)
+            futures.append(future)
+        return futures
+
+    def _handle_help(self, user_id: str, reply_token: str) -> None:
+        """說明命令（與其他文字命令相同的簽名）"""
+        self._send_help_message(reply_token)
+
+    def _send_help_message(self, reply_token: str) -> None:
+        """發送說明訊息"""
+        self._send_reply(reply_token, HELP_TEXT, quick_reply=HELP_QUICK_REPLY)
 
     def _start_batch_mode(self, user_id: str, reply_token: str) -> None:
         """開始批次模式"""
@@ -390,12 +436,7 @@ class UnifiedEventHandler:
         self._send_reply(
             reply_token,
             "📦 批次模式已啟動\n\n請連續上傳多張名片照片\n完成後輸入「結束批次」",
-            quick_reply=QuickReply(
-                items=[
-                    QuickReplyItem(action=MessageAction(label="結束批次", text="結束批次")),
-                    QuickReplyItem(action=MessageAction(label="查看進度", text="狀態")),
-                ]
-            ),
+            quick_reply=BATCH_MODE_QUICK_REPLY,
         )
 
         logger.info("Batch mode started", user_id=user_id)
@@ -521,11 +562,7 @@ class UnifiedEventHandler:
         self._send_reply(
             reply_token,
             "❓ 不認識的指令\n輸入「幫助」查看使用說明",
-            quick_reply=QuickReply(
-                items=[
-                    QuickReplyItem(action=MessageAction(label="查看說明", text="幫助")),
-                ]
-            ),
+            quick_reply=UNKNOWN_COMMAND_QUICK_REPLY,
         )
 
     def _send_processing_result(
@@ -772,3 +809,14 @@ Email：{card.email or '未識別'}"""
         except Exception as e:
             logger.warning("Failed to save user profile", error=str(e), user_id=user_id)
 
+
+# 文字命令對照表（別名 -> 未綁定的處理方法），處理方法皆接受 (self, user_id, reply_token)
+# 直接引用方法物件，方法改名或拼錯時在匯入時即拋出 AttributeError
+TEXT_COMMANDS: Dict[str, Callable[[UnifiedEventHandler, str, str], None]] = {
+    **dict.fromkeys(["help", "說明", "幫助"], UnifiedEventHandler._handle_help),
+    **dict.fromkeys(["批次", "batch", "批量"], UnifiedEventHandler._start_batch_mode),
+    **dict.fromkeys(["狀態", "status", "進度"], UnifiedEventHandler._show_status),
+    **dict.fromkeys(["結束批次", "end batch", "完成批次"], UnifiedEventHandler._end_batch_mode),
+    **dict.fromkeys(["重試", "retry", "重新上傳"], UnifiedEventHandler._retry_failed_uploads),
+    **dict.fromkeys(["清除失敗", "clear failed"], UnifiedEventHandler._clear_failed_uploads),
+}
@@ -13,11 +13,15 @@ from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.webhooks import MessageEvent, TextMessageContent, ImageMessageContent
 from linebot.v3.messaging import Configuration, ApiClient, MessagingApi
 import structlog
+import orjson
 import os
 import sys
 import json
+import atexit
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait as futures_wait
 from datetime import datetime
-from typing import Optional
+from typing import Callable, Dict, Optional, Set
 
 # 添加項目根目錄到 Python 路徑
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../../..'))
@@ -57,6 +61,9 @@ _debug_log("D", "main.py:module_start", "LINE_BOT_MAIN_MODULE_START", {})
 
 app = Flask(__name__)
 
+# Webhook 請求大小上限（1MB），只套用於 /callback
+WEBHOOK_MAX_BODY_SIZE = 1024 * 1024
+
 # ==================== 預設單租戶服務 (向後相容) ====================
 
 # #region agent log
@@ -133,7 +140,7 @@ def extract_channel_id(body: str) -> Optional[str]:
     在設定租戶時，需要使用 Bot User ID 作為 line_channel_id。
     """
     try:
-        data = json.loads(body)
+        data = orjson.loads(body)
         # destination 是接收此 webhook 的 Bot 的 User ID
         destination = data.get('destination')
         if destination:
@@ -272,6 +279,102 @@ def try_auto_activate_tenant(body: str, signature: str, channel_id: str) -> Opti
         return None
 
 
+# ==================== 背景事件處理 ====================
+
+# LINE 要求 webhook 在數秒內回應，AI 識別可能耗時數十秒，
+# 因此簽名驗證後即交給背景線程池處理並回應 200。
+# 多個 worker 避免所有租戶/用戶排在同一個慢請求之後（reply token 有效期很短）；
+# 同一次 webhook 內的事件仍依序處理。
+EVENT_WORKERS = int(os.getenv("EVENT_WORKERS", "4"))
+# 同時排隊/處理中的 webhook 上限，超過時改在請求線程同步處理（背壓）
+MAX_PENDING_EVENTS = int(os.getenv("EVENT_MAX_PENDING", "32"))
+
+_events_executor: Optional[ThreadPoolExecutor] = None
+_events_executor_lock = threading.Lock()
+_events_slots = threading.BoundedSemaphore(MAX_PENDING_EVENTS)
+_pending_events: Set[Future] = set()
+
+
+def _get_events_executor() -> ThreadPoolExecutor:
+    """取得背景事件線程池（首次使用時建立）"""
+    global _events_executor
+
+    with _events_executor_lock:
+        if _events_executor is None:
+            _events_executor = ThreadPoolExecutor(
+                max_workers=EVENT_WORKERS, thread_name_prefix="LineEventWorker"
+            )
+        return _events_executor
+
+
+def _run_event_processing(func, *args) -> None:
+    """執行事件處理，錯誤只記錄不外拋"""
+    try:
+        func(*args)
+    except Exception as e:
+        logger.error("Background event processing error",
+                    error=str(e),
+                    error_type=type(e).__name__)
+
+
+def _release_event_slot(future: Future) -> None:
+    """背景工作完成後釋放排隊名額"""
+    with _events_executor_lock:
+        _pending_events.discard(future)
+    _events_slots.release()
+
+
+def enqueue_event_processing(func, *args) -> None:
+    """
+    將事件處理交給背景線程池
+
+    排隊/處理中的工作已達 MAX_PENDING_EVENTS 時，直接在目前的請求線程處理，
+    讓負載回壓到 webhook 回應時間，而不是無上限地累積在記憶體中。
+    """
+    if not _events_slots.acquire(blocking=False):
+        logger.warning("Event backlog full, processing inline", max_pending=MAX_PENDING_EVENTS)
+        _run_event_processing(func, *args)
+        return
+
+    try:
+        future = _get_events_executor().submit(_run_event_processing, func, *args)
+    except RuntimeError:
+        # 線程池已關閉（程序結束中），改為同步處理
+        _events_slots.release()
+        _run_event_processing(func, *args)
+        return
+
+    with _events_executor_lock:
+        _pending_events.add(future)
+    future.add_done_callback(_release_event_slot)
+    logger.info("Webhook events queued", pending=len(_pending_events))
+
+
+def wait_for_pending_events(timeout: Optional[float] = None) -> bool:
+    """
+    等待所有已排入的事件處理完成
+
+    Returns:
+        bool: 在逾時前全部完成時為 True
+    """
+    with _events_executor_lock:
+        pending = list(_pending_events)
+    _, not_done = futures_wait(pending, timeout=timeout)
+    return not not_done
+
+
+@atexit.register
+def shutdown_event_processing() -> None:
+    """程序結束（部署/重啟）時處理完已排入的事件，避免靜默遺失"""
+    global _events_executor
+
+    with _events_executor_lock:
+        executor, _events_executor = _events_executor, None
+    if executor is not None:
+        logger.info("Draining webhook events before shutdown", pending=len(_pending_events))
+        executor.shutdown(wait=True)
+
+
 # ==================== Webhook 端點 ====================
 
 @app.route("/callback", methods=['POST'])
@@ -283,6 +386,12 @@ def callback():
     根據 Channel ID 動態路由到對應的租戶配置。
     """
     signature = request.headers.get('X-Line-Signature', '')
+
+    # 檢查請求大小（1MB 限制）：先看 Content-Length，超過時不讀取 body
+    if (request.content_length or 0) > WEBHOOK_MAX_BODY_SIZE:
+        logger.warning("Webhook request too large", size=request.content_length)
+        return jsonify({"status": "request too large"}), 200
+
     body = request.get_data(as_text=True)
 
     # 基本輸入驗證
@@ -290,8 +399,8 @@ def callback():
         logger.warning("Missing signature or body in webhook request")
         return jsonify({"status": "missing signature or body"}), 200
 
-    # 檢查請求大小（1MB 限制）
-    if len(body) > 1024 * 1024:
+    # 沒有 Content-Length（chunked 傳輸）時，讀取後再檢查一次
+    if len(body) > WEBHOOK_MAX_BODY_SIZE:
         logger.warning("Webhook request too large", size=len(body))
         return jsonify({"status": "request too large"}), 200
 
@@ -341,6 +450,17 @@ def process_multi_tenant(body: str, signature: str, context: TenantContext):
                         tenant_id=context.tenant_id)
             return jsonify({"status": "invalid signature"}), 200
 
+    # 排入背景處理，立即回應 LINE
+    enqueue_event_processing(process_tenant_events, body, context)
+    return 'OK'
+
+
+def process_tenant_events(body: str, context: TenantContext):
+    """
+    處理租戶的 webhook 事件（於背景線程執行）
+
+    錯誤會記錄到租戶使用統計。
+    """
     try:
         # 創建租戶專屬的事件處理器
         # #region agent log
@@ -377,9 +497,6 @@ def process_multi_tenant(body: str, signature: str, context: TenantContext):
             tenant_service.record_usage(context.tenant_id, errors=1)
         except Exception:
             pass
-        return jsonify({"status": "processing error"}), 200
-
-    return 'OK'
 
 
 def process_default(body: str, signature: str):
@@ -416,12 +533,19 @@ def process_default(body: str, signature: str):
     else:
         logger.info("Signature validation skipped in non-production environment")
 
-    try:
-        # 檢查 event handler 是否可用
-        if default_event_handler is None:
-            logger.error("Default event handler not initialized - check service configuration")
-            return jsonify({"status": "service not configured"}), 200
+    # 檢查 event handler 是否可用
+    if default_event_handler is None:
+        logger.error("Default event handler not initialized - check service configuration")
+        return jsonify({"status": "service not configured"}), 200
+
+    # 排入背景處理，立即回應 LINE
+    enqueue_event_processing(process_default_events, body, signature)
+    return 'OK'
+
 
+def process_default_events(body: str, signature: str):
+    """處理預設模式的 webhook 事件（於背景線程執行）"""
+    try:
         # 開發環境：手動解析
         if settings.flask_env != "production":
             process_events_manually(body)
@@ -432,15 +556,36 @@ def process_default(body: str, signature: str):
 
     except InvalidSignatureError:
         logger.error("Invalid LINE signature")
-        return jsonify({"status": "invalid signature error"}), 200
 
     except Exception as e:
         logger.error("Webhook processing error",
                     error=str(e),
                     error_type=type(e).__name__)
-        return jsonify({"status": "processing error"}), 200
 
-    return 'OK'
+
+def _dispatch_text_message(event_handler: UnifiedEventHandler, user_id: str, message: dict, reply_token: str):
+    """分派文字訊息"""
+    text = message.get('text', '').strip()
+    event_handler.handle_text_message(user_id, text, reply_token)
+
+
+def _dispatch_image_message(event_handler: UnifiedEventHandler, user_id: str, message: dict, reply_token: str):
+    """分派圖片訊息"""
+    message_id = message.get('id')
+    # #region agent log
+    logger.warning("DEBUG_CALLING_HANDLE_IMAGE", message_id=message_id, user_id=user_id[:10] + "...")
+    # #endregion
+    event_handler.handle_image_message(user_id, message_id, reply_token)
+    # #region agent log
+    logger.warning("DEBUG_HANDLE_IMAGE_RETURNED", message_id=message_id)
+    # #endregion
+
+
+# 訊息類型 -> 分派函數，皆接受 (event_handler, user_id, message, reply_token)
+MESSAGE_DISPATCH: Dict[str, Callable] = {
+    'text': _dispatch_text_message,
+    'image': _dispatch_image_message,
+}
 
 
 def process_events_with_handler(body: str, event_handler: UnifiedEventHandler, configuration=None):
@@ -453,7 +598,8 @@ def process_events_with_handler(body: str, event_handler: UnifiedEventHandler, c
         configuration: LINE Configuration (v3) - 不再需要，保留向後相容
     """
     try:
-        webhook_data = json.loads(body)
+        # orjson.JSONDecodeError 繼承自 json.JSONDecodeError，下方錯誤處理不變
+        webhook_data = orjson.loads(body)
         events = webhook_data.get('events', [])
 
         # #region agent log
@@ -482,21 +628,10 @@ def process_events_with_handler(body: str, event_handler: UnifiedEventHandler, c
                 logger.warning("Missing user_id or reply_token")
                 continue
 
-            # 處理訊息
-            if message_type == 'text':
-                text = message.get('text', '').strip()
-                event_handler.handle_text_message(user_id, text, reply_token)
-
-            elif message_type == 'image':
-                message_id = message.get('id')
-                # #region agent log
-                logger.warning("DEBUG_CALLING_HANDLE_IMAGE", message_id=message_id, user_id=user_id[:10] + "...")
-                # #endregion
-                event_handler.handle_image_message(user_id, message_id, reply_token)
-                # #region agent log
-                logger.warning("DEBUG_HANDLE_IMAGE_RETURNED", message_id=message_id)
-                # #endregion
-
+            # 處理訊息（依訊息類型查表分派）
+            dispatch = MESSAGE_DISPATCH.get(message_type)
+            if dispatch:
+                dispatch(event_handler, user_id, message, reply_token)
             else:
                 logger.info("Unsupported message type", message_type=message_type)
 
@@ -778,7 +913,6 @@ def worker_status():
 def list_failed_tasks():
     """列出所有失敗的上傳任務"""
     from src.namecard.infrastructure.redis_client import get_redis_client
-    import json
     
     try:
         redis_client = get_redis_client()
@@ -795,9 +929,8 @@ def list_failed_tasks():
             key_str = key.decode() if isinstance(key, bytes) else key
             data = redis_client.get(key)
             if data:
-                # 處理 data 可能是 bytes 或 str
-                data_str = data.decode() if isinstance(data, bytes) else data
-                task_data = json.loads(data_str)
+                # orjson 可直接解析 bytes 或 str，不需先解碼（任務內含大型 base64 圖片）
+                task_data = orjson.loads(data)
                 # 不返回大的 image_data
                 task_data.pop("image_data_b64", None)
                 task_data["redis_key"] = key_str
@@ -823,7 +956,6 @@ def retry_all_failed():
     )
     from src.namecard.infrastructure.storage.notion_client import NotionClient
     from src.namecard.infrastructure.redis_client import get_redis_client
-    import json
     
     try:
         redis_client = get_redis_client()
@@ -842,9 +974,8 @@ def retry_all_failed():
             if not data:
                 continue
             
-            # 處理 data 可能是 bytes 或 str
-            data_str = data.decode() if isinstance(data, bytes) else data
-            task_data = json.loads(data_str)
+            # orjson 可直接解析 bytes 或 str，不需先解碼（任務內含大型 base64 圖片）
+            task_data = orjson.loads(data)
             user_id = task_data.get("user_id", "unknown")
             task_id = task_data.get("task_id", "unknown")
             page_ids = task_data.get("page_ids", [])
@@ -4,6 +4,7 @@ Subscription Service for Multi-Tenant Commercialization
 Manages subscription plans, plan versions, and tenant plan assignments.
 """
 
+import time
 import uuid
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
@@ -23,8 +24,13 @@ class SubscriptionService:
     - Version control for plan changes (grandfathering)
     - Assign plans to tenants
     - Renew subscriptions with latest version
+    - In-memory caching of plan lookups with TTL
     """
 
+    # Cache TTL in seconds. Kept short because each worker process has its own
+    # cache and only sees its own invalidations; billing writes bypass the cache.
+    CACHE_TTL = 30
+
     def __init__(self, db: Optional[TenantDatabase] = None):
         """
         Initialize the subscription service.
@@ -33,8 +39,31 @@ class SubscriptionService:
             db: TenantDatabase instance. If None, uses global instance.
         """
         self.db = db or get_tenant_db()
+
+        # In-memory cache: {cache_key: (data, timestamp)}
+        self._cache: Dict[str, tuple] = {}
+
         logger.info("SubscriptionService initialized")
 
+    def _get_cache(self, key: str) -> Optional[Any]:
+        """Get value from cache if not expired"""
+        if key in self._cache:
+            data, timestamp = self._cache[key]
+            if time.time() - timestamp < self.CACHE_TTL:
+                return data
+            else:
+                del self._cache[key]
+        return None
+
+    def _set_cache(self, key: str, data: Any):
+        """Set value in cache"""
+        self._cache[key] = (data, time.time())
+
+    def _invalidate_cache(self):
+        """Clear all cached plan lookups after a plan or version changes"""
+        self._cache.clear()
+        logger.debug("Plan cache cleared")
+
     # ==================== Plan Operations ====================
 
     def list_plans(self, include_inactive: bool = False) -> List[Dict[str, Any]]:
@@ -47,6 +76,12 @@ class SubscriptionService:
         Returns:
             List of plans with current version details
         """
+        cache_key = f"plans:{'all' if include_inactive else 'active'}"
+        cached = self._get_cache(cache_key)
+        if cached is not None:
+            # Hand out copies so callers cannot mutate the cached rows
+            return [dict(plan) for plan in cached]
+
         with self.db.get_connection() as conn:
             query = """
                 SELECT 
@@ -68,18 +103,28 @@ class SubscriptionService:
             query += " ORDER BY sp.sort_order"
             
             cursor = conn.execute(query)
-            return [dict(row) for row in cursor.fetchall()]
+            plans = [dict(row) for row in cursor.fetchall()]
 
-    def get_plan(self, plan_id: str) -> Optional[Dict[str, Any]]:
+        self._set_cache(cache_key, plans)
+        return [dict(plan) for plan in plans]
+
+    def get_plan(self, plan_id: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
         """
         Get a plan with its current version details.
         
         Args:
             plan_id: Plan ID or name
+            use_cache: Serve from the in-memory cache when possible. Pass False
+                when the result decides which version a tenant is billed for.
         
         Returns:
             Plan dict with current version details, or None
         """
+        cache_key = f"plan:{plan_id}"
+        cached = self._get_cache(cache_key) if use_cache else None
+        if cached is not None:
+            return dict(cached)
+
         with self.db.get_connection() as conn:
             cursor = conn.execute(
                 """
@@ -101,7 +146,13 @@ class SubscriptionService:
                 (plan_id, plan_id)
             )
             row = cursor.fetchone()
-            return dict(row) if row else None
+
+        if not row:
+            return None
+
+        plan = dict(row)
+        self._set_cache(cache_key, plan)
+        return dict(plan)
 
     def get_plan_version(self, version_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -221,6 +272,7 @@ class SubscriptionService:
                 )
             )
         
+        self._invalidate_cache()
         logger.info(
             "Plan version created",
             plan_id=plan_id,
@@ -291,6 +343,7 @@ class SubscriptionService:
                 values
             )
         
+        self._invalidate_cache()
         logger.info("Plan updated", plan_id=plan_id)
         return self.get_plan(plan_id)
 
@@ -315,7 +368,8 @@ class SubscriptionService:
         Returns:
             Dict with assignment details
         """
-        plan = self.get_plan(plan_id)
+        # Read the current version from the database, not a possibly stale cache
+        plan = self.get_plan(plan_id, use_cache=False)
         if not plan:
             return {"success": False, "message": f"Plan not found: {plan_id}"}
         
@@ -398,8 +452,8 @@ class SubscriptionService:
             
             plan_id = row["plan_id"]
         
-        # Get current version of the plan
-        plan = self.get_plan(plan_id)
+        # Get current version of the plan (uncached: decides what the tenant pays)
+        plan = self.get_plan(plan_id, use_cache=False)
         if not plan or not plan.get("current_version_id"):
             return {"success": False, "message": "Plan not found or has no current version"}
         
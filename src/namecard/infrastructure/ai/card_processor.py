@@ -1,13 +1,18 @@
 from google import genai
 from google.genai import types
 from PIL import Image
+import base64
+import hashlib
 import io
 import json
+import orjson
 import structlog
-from typing import List, Optional, Tuple
+from typing import List, Optional, Tuple, Union
 import sys
 import os
 import time
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
 from functools import wraps
 import traceback
@@ -32,10 +37,44 @@ from src.namecard.core.exceptions import (
 
 logger = structlog.get_logger()
 
+# Batch Mode 仍在排隊或執行中的狀態
+_BATCH_PENDING_STATES = frozenset({
+    "JOB_STATE_UNSPECIFIED",
+    "JOB_STATE_QUEUED",
+    "JOB_STATE_PENDING",
+    "JOB_STATE_RUNNING",
+    "JOB_STATE_UPDATING",
+})
 
-@dataclass
+# 名片至少需具備其一的身分欄位
+_IDENTITY_FIELDS = ("name", "company")
+
+
+def _has_text(value) -> bool:
+    """是否為非空白字串"""
+    return isinstance(value, str) and bool(value.strip())
+
+
+def _has_essential_fields(card_data: dict) -> bool:
+    """以原始欄位快速判斷名片是否可能通過品質檢查
+
+    與 CardProcessor._validate_card_quality 規則一致：需有姓名或公司，
+    且至少一種聯絡方式 (電話、含 @ 的 email、地址)。
+    """
+    if not any(_has_text(card_data.get(field)) for field in _IDENTITY_FIELDS):
+        return False
+
+    email = card_data.get('email')
+    return (
+        _has_text(card_data.get('phone'))
+        or (_has_text(email) and '@' in email)
+        or _has_text(card_data.get('address'))
+    )
+
+
+@dataclass(frozen=True)
 class ProcessingConfig:
-    """處理配置類別"""
+    """處理配置類別 (不可變)"""
     max_image_size: Tuple[int, int] = (1920, 1920)
     max_file_size: int = 10 * 1024 * 1024  # 10MB
     min_confidence_threshold: float = 0.2  # 降低閾值提高識別率
@@ -111,6 +150,9 @@ class CardProcessor:
     提供高效的名片 OCR 識別功能，支援多卡片檢測、品質評估和錯誤恢復。
     使用 Google Gemini AI 進行圖像理解和文字擷取。
     """
+
+    # 圖片內容 hash -> Gemini 回應的快取上限
+    RESPONSE_CACHE_SIZE = 128
     
     def __init__(
         self,
@@ -132,6 +174,12 @@ class CardProcessor:
         self._api_call_count = 0
         self._last_api_call = 0
 
+        # 同一張圖片重複上傳時沿用先前的 Gemini 回應 (僅存於記憶體)
+        self._response_cache: "OrderedDict[Tuple[bytes, str], str]" = OrderedDict()
+        self._response_cache_lock = threading.Lock()
+        # 各線程最近一次分析實際使用的 fallback 模型 (None 表示由主要模型回應)
+        self._thread_state = threading.local()
+
         # API key 管理 - 支援自訂 key (多租戶) 或使用全域 key
         self.primary_api_key = api_key or settings.google_api_key
         self.fallback_api_key = fallback_api_key or settings.google_api_key_fallback
@@ -344,38 +392,70 @@ class CardProcessor:
             logger.info("No fallback API key configured")
             self.fallback_client = None
     
-    def process_image(self, image_data: bytes, user_id: str) -> List[BusinessCard]:
+    def process_image(self, image_data: Union[bytes, io.BytesIO], user_id: str) -> List[BusinessCard]:
         """
         處理名片圖片
         
         Args:
-            image_data: 圖片二進制數據
+            image_data: 圖片二進制數據，或已包含圖片內容的 BytesIO (直接讀取，不另外複製)
             user_id: LINE 用戶 ID
             
         Returns:
             識別到的名片列表
         """
+        image_size = None
+
         try:
+            if isinstance(image_data, io.BytesIO):
+                image_stream = image_data
+                image_stream.seek(0)
+                with image_stream.getbuffer() as view:
+                    image_size = view.nbytes
+                    image_digest = hashlib.blake2b(view, digest_size=16).digest()
+            else:
+                image_stream = io.BytesIO(image_data)
+                image_size = len(image_data)
+                image_digest = hashlib.blake2b(image_data, digest_size=16).digest()
+
             # 記錄處理開始
             logger.info(
                 "Starting card processing",
-                image_size=len(image_data),
+                image_size=image_size,
                 user_id=user_id,
                 operation="ai_processing"
             )
             
-            # 轉換圖片格式
-            image = Image.open(io.BytesIO(image_data))
-            
-            # 圖片預處理
-            image = self._preprocess_image(image)
-            
-            # 使用 Gemini 分析
-            response = self._analyze_with_gemini(image)
+            cache_key = (image_digest, "gemini-2.5-flash")
+            response = self._get_cached_response(cache_key)
+            cache_response = False
+
+            if response is None:
+                # 轉換圖片格式
+                image = Image.open(image_stream)
+
+                # 圖片預處理
+                image = self._preprocess_image(image)
+
+                # 使用 Gemini 分析
+                self._thread_state.fallback_model = None
+                response = self._analyze_with_gemini(image)
+
+                # 只快取主要模型的回應，fallback 模型的結果不能以主要模型的 key 重用
+                cache_response = self._thread_state.fallback_model is None
+            else:
+                logger.info(
+                    "Reusing cached Gemini response for identical image",
+                    user_id=user_id,
+                    operation="ai_processing"
+                )
             
             # 解析結果
             cards = self._parse_response(response, user_id)
 
+            # 只快取成功識別出名片的回應，失敗的圖片重新上傳時仍會重新分析
+            if cards and cache_response:
+                self._set_cached_response(cache_key, response)
+
             # 檢查是否識別到名片
             if not cards:
                 logger.warning(
@@ -392,7 +472,7 @@ class CardProcessor:
                 "Card processing completed successfully",
                 user_id=user_id,
                 cards_count=len(cards),
-                image_size=len(image_data),
+                image_size=image_size,
                 api_calls=self._api_call_count,
                 success_rate=len(cards) > 0,
                 operation="card_processing",
@@ -439,7 +519,7 @@ class CardProcessor:
                 user_id=user_id,
                 error=str(e),
                 error_type=type(e).__name__,
-                image_size=len(image_data),
+                image_size=image_size,
                 api_call_count=self._api_call_count,
                 operation="card_processing",
                 traceback=traceback.format_exc()
@@ -451,6 +531,191 @@ class CardProcessor:
             # 拋出異常而不是返回空列表
             raise
     
+    def _get_cached_response(self, cache_key: Tuple[bytes, str]) -> Optional[str]:
+        """取得快取的 Gemini 回應並標記為最近使用"""
+        with self._response_cache_lock:
+            response = self._response_cache.get(cache_key)
+            if response is not None:
+                self._response_cache.move_to_end(cache_key)
+            return response
+
+    def _set_cached_response(self, cache_key: Tuple[bytes, str], response: str) -> None:
+        """寫入 Gemini 回應快取，超過上限時淘汰最久未使用的項目"""
+        with self._response_cache_lock:
+            self._response_cache[cache_key] = response
+            self._response_cache.move_to_end(cache_key)
+            while len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+
+    def submit_batch(self, images: List[bytes], user_id: str) -> str:
+        """提交多張名片圖片至 Gemini Batch Mode
+
+        每張圖片預處理後打包成一行 JSONL 請求，上傳後建立單一批次工作。
+        Batch Mode 以非同步方式處理，費用為標準請求的 50%。
+
+        目前僅提供給程式庫呼叫端使用，LINE 事件處理流程仍走即時的 process_image。
+
+        Args:
+            images: 圖片二進制數據列表
+            user_id: LINE 用戶 ID
+
+        Returns:
+            批次工作名稱，供 poll_batch 查詢結果
+
+        Raises:
+            APIError: 當 Gemini client 未初始化時
+        """
+        if not self.client:
+            raise APIError("Gemini client not initialized")
+
+        lines = []
+        for idx, image_data in enumerate(images):
+            image = self._preprocess_image(Image.open(io.BytesIO(image_data)))
+            buffer = io.BytesIO()
+            image.save(buffer, format='PNG')
+
+            lines.append(json.dumps({
+                "key": f"{user_id}-{idx}",
+                "request": {
+                    "contents": [{
+                        "parts": [
+                            {"text": self.card_prompt},
+                            {"inline_data": {
+                                "mime_type": "image/png",
+                                "data": base64.b64encode(buffer.getvalue()).decode('ascii')
+                            }}
+                        ]
+                    }],
+                    "generation_config": {
+                        "temperature": 0.1,
+                        "max_output_tokens": 8192,
+                        "response_mime_type": "application/json"
+                    },
+                    "safety_settings": [
+                        {"category": category, "threshold": "BLOCK_NONE"}
+                        for category in (
+                            "HARM_CATEGORY_HARASSMENT",
+                            "HARM_CATEGORY_HATE_SPEECH",
+                            "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+                            "HARM_CATEGORY_DANGEROUS_CONTENT",
+                        )
+                    ]
+                }
+            }, ensure_ascii=False))
+
+        uploaded_file = self.client.files.upload(
+            file=io.BytesIO("\n".join(lines).encode('utf-8')),
+            config=types.UploadFileConfig(
+                display_name=f"namecard-batch-{user_id}",
+                mime_type="jsonl"
+            )
+        )
+
+        batch_job = self.client.batches.create(
+            model="gemini-2.5-flash",
+            src=uploaded_file.name,
+            config=types.CreateBatchJobConfig(display_name=f"namecard-batch-{user_id}")
+        )
+        self._api_call_count += 1
+
+        logger.info(
+            "Gemini batch job submitted",
+            batch_name=batch_job.name,
+            user_id=user_id,
+            image_count=len(images),
+            operation="batch_submit"
+        )
+
+        return batch_job.name
+
+    def poll_batch(
+        self, batch_name: str, user_id: str, image_count: int
+    ) -> Optional[List[List[BusinessCard]]]:
+        """查詢 Gemini 批次工作並解析結果
+
+        與 submit_batch 相同，目前僅提供給程式庫呼叫端使用。
+
+        Args:
+            batch_name: submit_batch 回傳的批次工作名稱
+            user_id: LINE 用戶 ID
+            image_count: 提交給 submit_batch 的圖片數量
+
+        Returns:
+            批次仍在處理中時回傳 None；完成時依提交順序回傳 image_count 個名片列表，
+            單張圖片失敗或批次輸出缺少該圖片時，該位置為空列表
+
+        Raises:
+            APIError: 當 Gemini client 未初始化或批次工作失敗時
+        """
+        if not self.client:
+            raise APIError("Gemini client not initialized")
+
+        batch_job = self.client.batches.get(name=batch_name)
+        state = batch_job.state.name if batch_job.state else "JOB_STATE_UNSPECIFIED"
+
+        if state in _BATCH_PENDING_STATES:
+            logger.debug("Gemini batch job still pending", batch_name=batch_name, state=state)
+            return None
+
+        if state != "JOB_STATE_SUCCEEDED":
+            logger.error(
+                "Gemini batch job did not succeed",
+                batch_name=batch_name,
+                state=state,
+                error=str(batch_job.error),
+                operation="batch_poll"
+            )
+            raise APIError(f"Gemini batch job {batch_name} ended with state {state}")
+
+        content = self.client.files.download(file=batch_job.dest.file_name)
+
+        results = {}
+        for line in content.decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+
+            entry = orjson.loads(line)
+            idx = int(entry["key"].rsplit("-", 1)[1])
+
+            if "error" in entry:
+                logger.warning(
+                    "Gemini batch request failed",
+                    batch_name=batch_name,
+                    key=entry["key"],
+                    error=entry["error"]
+                )
+                results[idx] = []
+                continue
+
+            try:
+                parts = entry["response"]["candidates"][0]["content"]["parts"]
+                response_text = "".join(part.get("text", "") for part in parts)
+                results[idx] = self._parse_response(response_text, user_id)
+            except Exception as e:
+                logger.warning(
+                    "Failed to parse Gemini batch response",
+                    batch_name=batch_name,
+                    key=entry["key"],
+                    error=str(e)
+                )
+                results[idx] = []
+
+        missing = [idx for idx in range(image_count) if idx not in results]
+        if missing:
+            logger.warning("Gemini batch output missing images", batch_name=batch_name, missing=missing)
+        cards_per_image = [results.get(idx, []) for idx in range(image_count)]
+
+        logger.info(
+            "Gemini batch job completed",
+            batch_name=batch_name,
+            user_id=user_id,
+            image_count=len(cards_per_image),
+            cards_count=sum(len(cards) for cards in cards_per_image),
+            operation="batch_poll"
+        )
+
+        return cards_per_image
+
     def _preprocess_image(self, image: Image.Image) -> Image.Image:
         """圖片預處理和優化
         
@@ -465,6 +730,13 @@ class CardProcessor:
         """
         try:
             original_size = image.size
+            max_size = self.config.max_image_size
+
+            # JPEG 尚未解碼時，讓解碼器直接以 1/2、1/4、1/8 縮小並輸出 RGB，避免先解出全尺寸圖片
+            if image.format == 'JPEG':
+                ratio = min(max_size[0] / image.size[0], max_size[1] / image.size[1])
+                if ratio < 1:
+                    image.draft('RGB', (int(image.size[0] * ratio), int(image.size[1] * ratio)))
             
             # 轉換為 RGB 格式
             if image.mode not in ('RGB', 'L'):
@@ -472,7 +744,6 @@ class CardProcessor:
                 logger.debug("Image converted to RGB")
             
             # 智能尺寸調整
-            max_size = self.config.max_image_size
             if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
                 # 計算縮放比例，保持長寬比
                 ratio = min(max_size[0] / image.size[0], max_size[1] / image.size[1])
@@ -481,7 +752,8 @@ class CardProcessor:
                     int(image.size[1] * ratio)
                 )
                 
-                image = image.resize(new_size, Image.Resampling.LANCZOS)
+                # BILINEAR 縮圖時同樣具抗鋸齒效果，速度約為 LANCZOS 的兩倍
+                image = image.resize(new_size, Image.Resampling.BILINEAR)
                 
                 logger.info(
                     "Image resized for optimization",
@@ -627,6 +899,7 @@ class CardProcessor:
                             operation="fallback_success"
                         )
 
+                        self._thread_state.fallback_model = "gemini-2.5-flash-lite"
                         return fallback_response.text.strip()
 
                     except EmptyAIResponseError:
@@ -761,6 +1034,7 @@ class CardProcessor:
                             operation="quota_fallback_success"
                         )
 
+                        self._thread_state.fallback_model = "gemini-2.5-flash-lite"
                         return fallback_response.text.strip()
 
                     except Exception as fallback_error:
@@ -802,19 +1076,56 @@ class CardProcessor:
     
     def _parse_response(self, response_text: str, user_id: str) -> List[BusinessCard]:
         """解析 Gemini 回應"""
+        # 空回應不需進入 JSON 解析
+        if not isinstance(response_text, str) or not response_text.strip():
+            raise EmptyAIResponseError(details={"user_id": user_id, "reason": "empty_response_text"})
+
         try:
             # 清理回應文字（移除可能的 markdown 標記）
             response_text = response_text.replace('```json', '').replace('```', '').strip()
             
             # 解析 JSON
-            data = json.loads(response_text)
+            data = orjson.loads(response_text)
+
+            if not isinstance(data, dict):
+                logger.error("Gemini response is not a JSON object",
+                            response_type=type(data).__name__,
+                            response=response_text[:500])
+                raise JSONParsingError(
+                    raw_response=response_text,
+                    details={"error": "top-level JSON is not an object", "response_preview": response_text[:500]}
+                )
             
             cards = []
             cards_data = data.get('cards', [])
+            if not isinstance(cards_data, list):
+                logger.warning("Gemini response 'cards' is not a list, skipped",
+                             cards_type=type(cards_data).__name__)
+                cards_data = []
+            min_confidence = self.config.min_confidence_threshold
+            min_quality = self.config.min_quality_threshold
             
             for card_data in cards_data:
                 try:
-                    # 建立名片物件
+                    confidence_score = float(card_data.get('confidence_score', 0.0))
+                    quality_score = float(card_data.get('quality_score', 0.0))
+
+                    # 先以分數門檻篩選，未達標的名片不需建立 BusinessCard
+                    if confidence_score < min_confidence or quality_score < min_quality:
+                        logger.warning("Card quality too low, skipped",
+                                     confidence=confidence_score,
+                                     quality=quality_score)
+                        continue
+
+                    # 缺少姓名/公司或聯絡方式的名片同樣無法通過品質檢查
+                    if not _has_essential_fields(card_data):
+                        logger.warning("Card missing essential fields, skipped",
+                                     name=card_data.get('name'),
+                                     company=card_data.get('company'))
+                        continue
+
+                    # 建立名片物件（保留完整驗證：欄位驗證器負責電話/傳真/地址正規化
+                    # 與無效 email 清除，不能以 model_construct 略過）
                     card = BusinessCard(
                         name=card_data.get('name'),
                         company=card_data.get('company'),
@@ -826,8 +1137,8 @@ class CardProcessor:
                         website=card_data.get('website'),
                         fax=card_data.get('fax'),
                         line_id=card_data.get('line_id'),
-                        confidence_score=float(card_data.get('confidence_score', 0.0)),
-                        quality_score=float(card_data.get('quality_score', 0.0)),
+                        confidence_score=confidence_score,
+                        quality_score=quality_score,
                         line_user_id=user_id
                     )
                     
@@ -861,6 +1172,8 @@ class CardProcessor:
             
             return cards
             
+        except JSONParsingError:
+            raise
         except json.JSONDecodeError as e:
             logger.error("Failed to parse JSON response",
                         error=str(e),
@@ -927,13 +1240,20 @@ class CardProcessor:
             suggestions.append("💡 提示：光線充足且名片平整效果更佳")
             return suggestions
         
-        low_confidence_cards = [c for c in cards if c.confidence_score < 0.7]
-        if low_confidence_cards:
-            suggestions.append(f"⚠️ {len(low_confidence_cards)} 張名片信心度較低，建議重新拍攝")
+        # 單次掃描同時統計低信心度與資訊不完整的名片
+        low_confidence_count = 0
+        incomplete_count = 0
+        for card in cards:
+            if card.confidence_score < 0.7:
+                low_confidence_count += 1
+            if not (card.name and card.company and (card.phone or card.email)):
+                incomplete_count += 1
+        
+        if low_confidence_count:
+            suggestions.append(f"⚠️ {low_confidence_count} 張名片信心度較低，建議重新拍攝")
         
-        incomplete_cards = [c for c in cards if not all([c.name, c.company, c.phone or c.email])]
-        if incomplete_cards:
-            suggestions.append(f"📝 {len(incomplete_cards)} 張名片資訊不完整，請檢查原始名片")
+        if incomplete_count:
+            suggestions.append(f"📝 {incomplete_count} 張名片資訊不完整，請檢查原始名片")
         
         if len(cards) > 1:
             suggestions.append(f"🎯 檢測到 {len(cards)} 張名片，已分別處理")
@@ -8,17 +8,22 @@
 失敗任務會記錄到 Redis，可供後續重試。
 """
 
-import queue
+import os
 import threading
+import time
 import structlog
 import json
 import base64
-from typing import List, Optional, Dict, Any, TYPE_CHECKING
-from dataclasses import dataclass
+import hashlib
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, List, Optional, Dict, Any, TYPE_CHECKING
+from dataclasses import dataclass, field
 from datetime import datetime
 from uuid import uuid4
 
 from src.namecard.infrastructure.storage.image_storage import get_image_storage
+from src.namecard.infrastructure.storage.notion_client import MAX_CONCURRENT_NOTION_REQUESTS
 from src.namecard.infrastructure.redis_client import get_redis_client
 
 if TYPE_CHECKING:
@@ -89,6 +94,22 @@ PENDING_TASK_TTL = 86400  # 1 day
 # RQ Queue name
 RQ_QUEUE_NAME = "image_upload"
 
+# 內存 Worker 並行上傳數（ImgBB / Notion 皆為 I/O bound）
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "8"))
+# 單一任務內並行更新 Notion 頁面的上限（實際請求另受 Notion client 全進程共用的名額限制）
+MAX_PAGE_UPDATE_WORKERS = MAX_CONCURRENT_NOTION_REQUESTS
+# 已上傳圖片 URL 快取筆數（相同圖片不重複上傳）
+URL_CACHE_SIZE = 128
+# 內存 Worker 最多同時持有的未完成任務數（每個任務持有一張圖片）
+MAX_INFLIGHT_UPLOADS = int(os.getenv("UPLOAD_MAX_INFLIGHT", "64"))
+# 隊列已滿時 submit 的預設等待秒數
+SUBMIT_TIMEOUT = 5.0
+# stop / start 等待派發線程結束的最長秒數
+STOP_JOIN_TIMEOUT = 10.0
+# ImgBB 上傳失敗時的重試：最多嘗試次數與指數退避基準秒數（1s, 2s）
+UPLOAD_MAX_ATTEMPTS = 3
+UPLOAD_RETRY_BASE_DELAY = 1.0
+
 # Check if RQ is available
 try:
     from rq import Queue, Retry
@@ -101,6 +122,11 @@ except Exception as e:
     logger.warning(f"RQ import failed: {e}, will use in-memory queue")
 
 
+class UploadQueueFullError(Exception):
+    """內存上傳隊列已滿，等待逾時仍無法提交任務"""
+    pass
+
+
 @dataclass
 class ImageUploadTask:
     """圖片上傳任務"""
@@ -109,6 +135,13 @@ class ImageUploadTask:
     page_ids: List[str]
     notion_client: "NotionClient"
     user_id: str
+    _data_hash: Optional[bytes] = field(default=None, init=False, repr=False, compare=False)
+
+    def data_hash(self) -> bytes:
+        """圖片內容雜湊（blake2b-128），首次計算後快取於任務上"""
+        if self._data_hash is None:
+            self._data_hash = hashlib.blake2b(self.image_data, digest_size=16).digest()
+        return self._data_hash
 
 
 # ============================================================
@@ -302,68 +335,184 @@ class ImageUploadWorker:
     """
     內存隊列 Worker（當 RQ 不可用時使用）
 
-    使用單一背景線程處理所有圖片上傳任務
+    由單一背景線程從隊列取出任務，交給線程池並行處理上傳
     """
 
-    def __init__(self):
-        self._queue: queue.Queue[ImageUploadTask] = queue.Queue()
+    def __init__(
+        self, max_workers: int = UPLOAD_WORKERS, max_inflight: int = MAX_INFLIGHT_UPLOADS
+    ):
+        # deque 的 append / popleft 為原子操作，以 Semaphore 計數喚醒派發線程
+        self._queue: Deque[Optional[ImageUploadTask]] = deque()
+        self._item_available = threading.Semaphore(0)
         self._worker_thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._max_workers = max_workers
         self._running = False
         self._lock = threading.Lock()
+        # 串行化 start / stop：停止進行中時 start 會等待，避免同時存在兩個派發線程
+        self._lifecycle_lock = threading.Lock()
+        # 已提交但尚未處理完成的任務數，歸零時通知 wait_until_idle
+        self._pending = 0
+        self._idle = threading.Condition()
+        # 限制未完成任務數，避免突發大量圖片時記憶體無限成長
+        self._capacity = threading.Semaphore(max_inflight)
+        # 圖片儲存實例，首次處理任務時取得，stop 時重置
+        self._storage = None
+        # 圖片內容雜湊 -> 已上傳 URL（LRU），以及上傳中的相同圖片
+        self._url_cache: "OrderedDict[bytes, str]" = OrderedDict()
+        self._inflight_uploads: Dict[bytes, Future] = {}
+        self._cache_lock = threading.Lock()
 
     def start(self) -> None:
-        """啟動 worker 線程"""
-        with self._lock:
+        """啟動 worker 線程與上傳線程池"""
+        with self._lifecycle_lock:
             if self._running:
                 return
 
-            self._running = True
-            self._worker_thread = threading.Thread(
-                target=self._process_queue, daemon=True, name="ImageUploadWorker"
-            )
-            self._worker_thread.start()
-            logger.info("ImageUploadWorker (in-memory) started")
+            # 上次 stop 等待逾時留下的派發線程仍會取走隊列與哨兵，須先結束並清理隊列
+            previous = self._worker_thread
+            if previous is not None:
+                if not self._join_dispatcher(previous):
+                    raise RuntimeError("Previous ImageUploadWorker dispatcher is still running")
+                self._cancel_queued_tasks()
+
+            with self._lock:
+                self._running = True
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix="ImageUpload"
+                )
+                self._worker_thread = threading.Thread(
+                    target=self._process_queue, daemon=True, name="ImageUploadWorker"
+                )
+                self._worker_thread.start()
+            logger.info("ImageUploadWorker (in-memory) started", max_workers=self._max_workers)
 
     def stop(self) -> None:
-        """停止 worker 線程"""
-        with self._lock:
-            self._running = False
-            self._queue.put(None)  # type: ignore
+        """停止 worker：先處理完已提交的任務，再結束派發線程與線程池"""
+        with self._lifecycle_lock:
+            with self._lock:
+                if not self._running:
+                    return
+                self._running = False
+                # 哨兵排在所有已提交任務之後，派發線程會先派發完隊列中的任務才結束
+                self._queue.append(None)
+                self._item_available.release()
+                worker_thread, executor = self._worker_thread, self._executor
+
+            # 先等派發線程結束，避免線程池關閉後仍有任務被提交
+            dispatcher_stopped = True
+            if worker_thread and worker_thread is not threading.current_thread():
+                dispatcher_stopped = self._join_dispatcher(worker_thread)
+            if executor:
+                executor.shutdown(wait=True)
+
+            # 派發線程仍在執行時隊列歸它所有，保留線程引用留待下次 start 清理
+            if dispatcher_stopped:
+                with self._lock:
+                    self._cancel_queued_tasks()
+                    self._worker_thread = None
+                    self._storage = None
+
+    @staticmethod
+    def _join_dispatcher(worker_thread: threading.Thread) -> bool:
+        """等待派發線程結束，回傳是否在 STOP_JOIN_TIMEOUT 內結束"""
+        worker_thread.join(timeout=STOP_JOIN_TIMEOUT)
+        if worker_thread.is_alive():
+            logger.error("ImageUploadWorker dispatcher did not stop in time", timeout=STOP_JOIN_TIMEOUT)
+            return False
+        return True
 
-    def submit(self, task: ImageUploadTask) -> None:
-        """提交任務"""
+    def _cancel_queued_tasks(self) -> None:
+        """
+        清空隊列（含哨兵），讓之後重新 start 的派發線程從乾淨狀態開始
+
+        停止期間才提交（排在哨兵之後）的任務不會被處理，記錄為失敗任務以便重試
+        """
+        while self._queue:
+            task = self._queue.popleft()
+            if task is not None:
+                logger.warning("Upload task cancelled, worker stopped", user_id=task.user_id)
+                self._record_failed_task(task, "Upload worker stopped before processing")
+                self._finish_task()
+        self._item_available = threading.Semaphore(0)
+
+    def submit(self, task: ImageUploadTask, timeout: float = SUBMIT_TIMEOUT) -> None:
+        """
+        提交任務
+
+        未完成任務數達上限時最多等待 timeout 秒
+
+        Raises:
+            UploadQueueFullError: 等待逾時仍無空位
+        """
         if not self._running:
             self.start()
 
-        self._queue.put(task)
+        if not self._capacity.acquire(timeout=timeout):
+            logger.error("In-memory upload queue full", user_id=task.user_id, timeout=timeout)
+            raise UploadQueueFullError(f"Upload queue full after waiting {timeout}s")
+
+        with self._idle:
+            self._pending += 1
+        self._queue.append(task)
+        self._item_available.release()
         logger.info(
             "Task submitted to in-memory queue",
             user_id=task.user_id,
             page_count=len(task.page_ids),
-            queue_size=self._queue.qsize(),
+            queue_size=len(self._queue),
         )
 
     def _process_queue(self) -> None:
-        """處理任務隊列"""
+        """從任務隊列取出任務並派發到線程池"""
         logger.info("ImageUploadWorker processing loop started")
 
-        while self._running:
-            try:
-                task = self._queue.get(timeout=5)
-
-                if task is None:
-                    break
-
-                self._process_task(task)
-                self._queue.task_done()
+        # 依序派發直到遇到 stop 放入的哨兵，確保停止前已提交的任務都會被處理
+        while True:
+            self._item_available.acquire()
+            task = self._queue.popleft()
+            if task is None:
+                break
 
-            except queue.Empty:
-                continue
+            try:
+                self._executor.submit(self._run_task, task)
             except Exception as e:
                 logger.error("Error in worker loop", error=str(e))
+                self._record_failed_task(task, f"Failed to dispatch upload task: {e}")
+                self._finish_task()
 
         logger.info("ImageUploadWorker stopped")
 
+    def _run_task(self, task: ImageUploadTask) -> None:
+        """在線程池中執行任務（例外不會傳回派發線程，需在此記錄）"""
+        try:
+            self._process_task(task)
+        except Exception as e:
+            logger.error("Error processing upload task", user_id=task.user_id, error=str(e))
+        finally:
+            self._finish_task()
+
+    def _finish_task(self) -> None:
+        """任務結束（完成或取消）：釋出空位並更新未完成任務數"""
+        self._capacity.release()
+        with self._idle:
+            self._pending -= 1
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def wait_until_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待所有已提交的任務處理完成
+
+        Args:
+            timeout: 最長等待秒數，None 表示無限等待
+
+        Returns:
+            是否在超時前全部完成
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout=timeout)
+
     def _process_task(self, task: ImageUploadTask) -> None:
         """處理單一上傳任務"""
         logger.warning(
@@ -371,7 +520,7 @@ class ImageUploadWorker:
         )
 
         # 1. 上傳圖片到 ImgBB
-        image_storage = get_image_storage()
+        image_storage = self._get_storage()
         logger.warning("DEBUG_MEMORY_IMAGE_STORAGE", storage_available=image_storage is not None)
         
         if not image_storage:
@@ -381,7 +530,7 @@ class ImageUploadWorker:
             return
 
         logger.warning("DEBUG_MEMORY_UPLOADING_TO_IMGBB", image_size=len(task.image_data))
-        image_url = image_storage.upload(task.image_data)
+        image_url = self._upload_image(image_storage, task)
         logger.warning("DEBUG_MEMORY_IMGBB_RESULT", success=image_url is not None, url_preview=image_url[:50] + "..." if image_url else None)
 
         if not image_url:
@@ -392,23 +541,21 @@ class ImageUploadWorker:
 
         logger.warning("DEBUG_MEMORY_UPDATING_NOTION", url=image_url[:50] + "...", page_count=len(task.page_ids))
 
-        # 2. 更新所有 Notion 頁面
-        success_count = 0
-        failed_page_ids = []
-
-        for page_id in task.page_ids:
-            try:
-                result = task.notion_client.update_page_with_image(page_id, image_url)
-                if result:
-                    success_count += 1
-                    logger.info("Page updated with image", page_id=page_id[:10] + "...")
-                else:
-                    failed_page_ids.append(page_id)
-            except Exception as e:
-                logger.error(
-                    "Failed to update page with image", page_id=page_id[:10] + "...", error=str(e)
+        # 2. 並行更新所有 Notion 頁面（每頁皆為獨立的 HTTP 請求）
+        page_ids = task.page_ids
+        if len(page_ids) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(page_ids), MAX_PAGE_UPDATE_WORKERS)) as pool:
+                results = list(
+                    pool.map(
+                        lambda page_id: self._safe_update(task.notion_client, page_id, image_url),
+                        page_ids,
+                    )
                 )
-                failed_page_ids.append(page_id)
+        else:
+            results = [self._safe_update(task.notion_client, page_id, image_url) for page_id in page_ids]
+
+        success_count = sum(results)
+        failed_page_ids = [page_id for page_id, ok in zip(page_ids, results) if not ok]
 
         if failed_page_ids:
             self._record_failed_task(
@@ -425,6 +572,83 @@ class ImageUploadWorker:
             total_pages=len(task.page_ids),
         )
 
+    def _get_storage(self):
+        """取得圖片儲存實例（未配置時不快取，之後的任務會再檢查）"""
+        if self._storage is None:
+            with self._lock:
+                if self._storage is None:
+                    self._storage = get_image_storage()
+        return self._storage
+
+    def _upload_image(self, image_storage, task: ImageUploadTask) -> Optional[str]:
+        """
+        上傳圖片，相同內容只上傳一次
+
+        已上傳過的圖片直接返回快取的 URL；若相同圖片正在其他線程上傳，
+        則等待該次上傳結果，不重複發送請求。上傳失敗不會被快取。
+        """
+        key = task.data_hash()
+
+        with self._cache_lock:
+            image_url = self._url_cache.get(key)
+            if image_url is not None:
+                self._url_cache.move_to_end(key)
+                return image_url
+
+            inflight = self._inflight_uploads.get(key)
+            if inflight is None:
+                inflight = self._inflight_uploads[key] = Future()
+                is_owner = True
+            else:
+                is_owner = False
+
+        if not is_owner:
+            return inflight.result()
+
+        image_url = None
+        try:
+            image_url = self._upload_with_retry(image_storage, task)
+        finally:
+            with self._cache_lock:
+                del self._inflight_uploads[key]
+                if image_url:
+                    self._url_cache[key] = image_url
+                    if len(self._url_cache) > URL_CACHE_SIZE:
+                        self._url_cache.popitem(last=False)
+            inflight.set_result(image_url)
+
+        return image_url
+
+    @staticmethod
+    def _upload_with_retry(image_storage, task: ImageUploadTask) -> Optional[str]:
+        """上傳圖片，失敗時以指數退避重試，全部失敗返回 None"""
+        for attempt in range(UPLOAD_MAX_ATTEMPTS):
+            if attempt:
+                delay = UPLOAD_RETRY_BASE_DELAY * 2 ** (attempt - 1)
+                logger.warning(
+                    "Retrying image upload", user_id=task.user_id, attempt=attempt + 1, delay=delay
+                )
+                time.sleep(delay)
+
+            image_url = image_storage.upload(task.image_data)
+            if image_url:
+                return image_url
+
+        return None
+
+    @staticmethod
+    def _safe_update(notion_client: "NotionClient", page_id: str, image_url: str) -> bool:
+        """更新單一頁面的圖片，失敗時記錄日誌並返回 False（不拋出例外）"""
+        try:
+            if notion_client.update_page_with_image(page_id, image_url):
+                logger.info("Page updated with image", page_id=page_id[:10] + "...")
+                return True
+        except Exception as e:
+            logger.error(
+                "Failed to update page with image", page_id=page_id[:10] + "...", error=str(e)
+            )
+        return False
+
     def _record_failed_task(
         self,
         task: ImageUploadTask,
@@ -721,6 +945,6 @@ def get_queue_info() -> Dict[str, Any]:
             info["error"] = str(e)
     else:
         if _worker:
-            info["queue_size"] = _worker._queue.qsize()
+            info["queue_size"] = len(_worker._queue)
 
     return info
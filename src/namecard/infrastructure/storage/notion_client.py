@@ -1,6 +1,8 @@
-from notion_client import Client
-from typing import Optional, Dict, Any, Tuple
+from notion_client import APIResponseError, Client
+from typing import Callable, Optional, Dict, Any, Tuple, TypeVar
 import structlog
+import threading
+import time
 from datetime import datetime
 import sys
 import os
@@ -38,6 +40,40 @@ def create_notion_client(api_key: str) -> Client:
     return Client(auth=api_key, notion_version=NOTION_API_VERSION)
 
 
+# Notion API 限流約為平均每秒 3 個請求：進程內所有並行寫入共用同一組名額，
+# 被限流（HTTP 429）時依 Retry-After（無則指數退避 1s, 2s）重試
+MAX_CONCURRENT_NOTION_REQUESTS = 3
+NOTION_RATE_LIMIT_MAX_ATTEMPTS = 3
+NOTION_RATE_LIMIT_BASE_DELAY = 1.0
+
+_notion_request_slots = threading.BoundedSemaphore(MAX_CONCURRENT_NOTION_REQUESTS)
+
+T = TypeVar("T")
+
+
+def _call_notion_api(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    在共用並行名額內呼叫 Notion API，被限流時退避後重試
+
+    退避等待期間不佔用名額；重試次數用盡或非限流錯誤時拋出原例外
+    """
+    for attempt in range(1, NOTION_RATE_LIMIT_MAX_ATTEMPTS + 1):
+        with _notion_request_slots:
+            try:
+                return func(*args, **kwargs)
+            except APIResponseError as e:
+                if e.status != 429 or attempt == NOTION_RATE_LIMIT_MAX_ATTEMPTS:
+                    raise
+                retry_after = e.headers.get("retry-after") if e.headers else None
+
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = NOTION_RATE_LIMIT_BASE_DELAY * (2 ** (attempt - 1))
+        logger.warning("Notion API rate limited, retrying", attempt=attempt, delay=delay)
+        time.sleep(delay)
+
+
 class NotionClient:
     """Notion 資料庫客戶端
 
@@ -270,7 +306,7 @@ class NotionClient:
             except Exception:
                 pass
             # #endregion
-            response = self.client.pages.create(**create_params)
+            response = _call_notion_api(self.client.pages.create, **create_params)
 
             page_url = response.get("url", "")
             page_id = response.get("id", "")
@@ -954,7 +990,8 @@ class NotionClient:
             }
 
             # 使用 Notion API 添加子區塊到頁面
-            result = self.client.blocks.children.append(
+            result = _call_notion_api(
+                self.client.blocks.children.append,
                 block_id=page_id,
                 children=[image_block]
             )
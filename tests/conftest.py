@@ -6,16 +6,23 @@ from unittest.mock import Mock, patch
 # 添加項目根目錄到 Python 路徑
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-# Mock genai before importing anything else to prevent initialization errors
-with patch('src.namecard.infrastructure.ai.card_processor.genai') as mock_genai:
-    mock_genai.configure.return_value = None
-    mock_model = Mock()
-    mock_model.generate_content.return_value = Mock(text='{"cards": []}')
-    mock_genai.GenerativeModel.return_value = mock_model
-    
-    from src.namecard.api.line_bot.main import app
-    from src.namecard.core.models.card import BusinessCard
-    from datetime import datetime
+# 整個測試階段只 patch 一次 genai：在匯入任何模組前啟動（涵蓋收集階段的 import），
+# 於 pytest_unconfigure 時停止。需要斷言 genai 呼叫的測試自行再套一層 @patch
+_genai_patcher = patch('src.namecard.infrastructure.ai.card_processor.genai')
+mock_genai = _genai_patcher.start()
+mock_genai.configure.return_value = None
+mock_model = Mock()
+mock_model.generate_content.return_value = Mock(text='{"cards": []}')
+mock_genai.GenerativeModel.return_value = mock_model
+
+from src.namecard.api.line_bot.main import app
+from src.namecard.core.models.card import BusinessCard
+from datetime import datetime
+
+
+def pytest_unconfigure(config):
+    """測試結束時還原 genai"""
+    _genai_patcher.stop()
 
 
 @pytest.fixture
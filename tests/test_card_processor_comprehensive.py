@@ -9,24 +9,40 @@ import time
 from unittest.mock import Mock, patch, MagicMock, call
 from PIL import Image
 import io
-from dataclasses import dataclass
+from dataclasses import dataclass, FrozenInstanceError
+from types import SimpleNamespace
 
 # Import test fixtures first, before importing actual classes
 from typing import List, Optional, Tuple
 
-# Mock genai before importing CardProcessor to prevent initialization errors
-with patch('src.namecard.infrastructure.ai.card_processor.genai') as mock_genai:
-    mock_genai.configure.return_value = None
-    mock_model = Mock()
-    mock_model.generate_content.return_value = Mock(text='{"cards": []}')
-    mock_genai.GenerativeModel.return_value = mock_model
-    
-    from src.namecard.infrastructure.ai.card_processor import (
-        CardProcessor, ProcessingConfig, ProcessingError, APIError, 
-        ValidationError, ImageProcessingError, with_error_handling, with_timing
-    )
+# genai 已由 conftest 在整個測試階段 patch
+from src.namecard.infrastructure.ai.card_processor import (
+    CardProcessor, ProcessingConfig, ProcessingError, APIError, 
+    ValidationError, ImageProcessingError, with_error_handling, with_timing
+)
 
 from src.namecard.core.models.card import BusinessCard
+from src.namecard.core.exceptions import EmptyAIResponseError, JSONParsingError
+
+_LANDSCAPE_RATIO = 3000 / 2000
+
+
+@pytest.fixture(scope="session")
+def large_landscape_image():
+    """Shared 3000x2000 image; _preprocess_image never mutates its input"""
+    return Image.new('RGB', (3000, 2000), color='white')
+
+
+@pytest.fixture(scope="session")
+def large_portrait_image():
+    """Shared 1000x3000 image; _preprocess_image never mutates its input"""
+    return Image.new('RGB', (1000, 3000), color='white')
+
+
+@pytest.fixture(scope="session")
+def oversized_image():
+    """Shared 4000x3000 image for the preprocessing performance check"""
+    return Image.new('RGB', (4000, 3000), color='white')
 
 
 class TestProcessingConfig:
@@ -63,6 +79,13 @@ class TestProcessingConfig:
         assert config.max_retries == 5
         assert config.retry_delay == 0.5
         assert config.timeout_seconds == 60
+    
+    def test_configuration_is_immutable(self):
+        """Test configuration cannot be modified after creation"""
+        config = ProcessingConfig()
+        
+        with pytest.raises(FrozenInstanceError):
+            config.min_confidence_threshold = 0.9
 
 
 class TestCustomExceptions:
@@ -193,11 +216,12 @@ class TestCardProcessorInitialization:
     """Test CardProcessor initialization scenarios"""
     
     @patch('src.namecard.infrastructure.ai.card_processor.genai')
-    @patch('src.namecard.infrastructure.ai.card_processor.settings')
-    def test_successful_primary_api_initialization(self, mock_settings, mock_genai):
+    def test_successful_primary_api_initialization(self, mock_genai, monkeypatch):
         """Test successful initialization with primary API key"""
-        mock_settings.google_api_key = "primary_key"
-        mock_settings.google_api_key_fallback = None
+        monkeypatch.setattr(
+            'src.namecard.infrastructure.ai.card_processor.settings',
+            SimpleNamespace(google_api_key="primary_key", google_api_key_fallback=None)
+        )
         mock_genai.configure.return_value = None
         mock_model = Mock()
         mock_model.generate_content.return_value = Mock(text="test")
@@ -209,11 +233,12 @@ class TestCardProcessorInitialization:
         assert processor.model is not None
     
     @patch('src.namecard.infrastructure.ai.card_processor.genai')
-    @patch('src.namecard.infrastructure.ai.card_processor.settings')
-    def test_fallback_api_initialization(self, mock_settings, mock_genai):
+    def test_fallback_api_initialization(self, mock_genai, monkeypatch):
         """Test initialization falls back to secondary API key"""
-        mock_settings.google_api_key = "primary_key"
-        mock_settings.google_api_key_fallback = "fallback_key"
+        monkeypatch.setattr(
+            'src.namecard.infrastructure.ai.card_processor.settings',
+            SimpleNamespace(google_api_key="primary_key", google_api_key_fallback="fallback_key")
+        )
         
         # Primary key fails, fallback succeeds
         mock_genai.configure.side_effect = [Exception("Primary API failed"), None]
@@ -229,11 +254,12 @@ class TestCardProcessorInitialization:
         assert processor.model is not None
     
     @patch('src.namecard.infrastructure.ai.card_processor.genai')
-    @patch('src.namecard.infrastructure.ai.card_processor.settings')
-    def test_all_api_keys_fail(self, mock_settings, mock_genai):
+    def test_all_api_keys_fail(self, mock_genai, monkeypatch):
         """Test initialization fails when all API keys fail"""
-        mock_settings.google_api_key = "primary_key"
-        mock_settings.google_api_key_fallback = "fallback_key"
+        monkeypatch.setattr(
+            'src.namecard.infrastructure.ai.card_processor.settings',
+            SimpleNamespace(google_api_key="primary_key", google_api_key_fallback="fallback_key")
+        )
         
         # Both keys fail
         mock_genai.configure.side_effect = [
@@ -245,10 +271,12 @@ class TestCardProcessorInitialization:
             CardProcessor()
     
     @patch('src.namecard.infrastructure.ai.card_processor.genai')
-    @patch('src.namecard.infrastructure.ai.card_processor.settings')
-    def test_custom_config_initialization(self, mock_settings, mock_genai):
+    def test_custom_config_initialization(self, mock_genai, monkeypatch):
         """Test initialization with custom configuration"""
-        mock_settings.google_api_key = "test_key"
+        monkeypatch.setattr(
+            'src.namecard.infrastructure.ai.card_processor.settings',
+            SimpleNamespace(google_api_key="test_key", google_api_key_fallback=None)
+        )
         mock_genai.configure.return_value = None
         mock_model = Mock()
         mock_model.generate_content.return_value = Mock(text="test")
@@ -270,8 +298,7 @@ class TestImagePreprocessing:
     
     def setup_method(self):
         """Setup for each test"""
-        with patch('src.namecard.infrastructure.ai.card_processor.genai'):
-            self.processor = CardProcessor()
+        self.processor = CardProcessor()
     
     def test_rgba_to_rgb_conversion(self):
         """Test RGBA image conversion to RGB"""
@@ -301,33 +328,38 @@ class TestImagePreprocessing:
         assert processed.mode == 'RGB'
         assert processed.size == (100, 100)
     
-    def test_oversized_image_resize(self):
+    def test_oversized_image_resize(self, large_landscape_image):
         """Test oversized image is properly resized"""
-        # Create image larger than max size
-        large_image = Image.new('RGB', (3000, 2000), color='white')
-        
-        processed = self.processor._preprocess_image(large_image)
+        processed = self.processor._preprocess_image(large_landscape_image)
         
         # Should be resized to fit within max dimensions while preserving aspect ratio
         assert processed.size[0] <= 1920
         assert processed.size[1] <= 1920
         # Check aspect ratio is preserved (approximately)
-        original_ratio = 3000 / 2000
-        new_ratio = processed.size[0] / processed.size[1]
-        assert abs(original_ratio - new_ratio) < 0.01
+        assert processed.size[0] / processed.size[1] == pytest.approx(_LANDSCAPE_RATIO, abs=0.01)
     
-    def test_portrait_oversized_image_resize(self):
+    def test_portrait_oversized_image_resize(self, large_portrait_image):
         """Test portrait oversized image resize"""
-        # Portrait orientation (height > width)
-        tall_image = Image.new('RGB', (1000, 3000), color='white')
-        
-        processed = self.processor._preprocess_image(tall_image)
+        processed = self.processor._preprocess_image(large_portrait_image)
         
         assert processed.size[0] <= 1920
         assert processed.size[1] <= 1920
         # Should maintain portrait orientation
         assert processed.size[1] > processed.size[0]
     
+    def test_jpeg_decoded_at_reduced_scale(self):
+        """Test oversized JPEGs are downscaled by the decoder before resizing"""
+        buffer = io.BytesIO()
+        Image.new('RGB', (4000, 3000), color='white').save(buffer, format='JPEG')
+        jpeg_image = Image.open(io.BytesIO(buffer.getvalue()))
+        
+        with patch.object(jpeg_image, 'draft', wraps=jpeg_image.draft) as mock_draft:
+            processed = self.processor._preprocess_image(jpeg_image)
+        
+        mock_draft.assert_called_once_with('RGB', (1920, 1440))
+        assert processed.mode == 'RGB'
+        assert processed.size == (1920, 1440)
+    
     def test_small_image_warning(self):
         """Test warning for small images"""
         small_image = Image.new('RGB', (200, 150), color='white')
@@ -360,8 +392,7 @@ class TestRateLimiting:
     
     def setup_method(self):
         """Setup for each test"""
-        with patch('src.namecard.infrastructure.ai.card_processor.genai'):
-            self.processor = CardProcessor()
+        self.processor = CardProcessor()
     
     @patch('src.namecard.infrastructure.ai.card_processor.time')
     def test_rate_limiting_sleep(self, mock_time):
@@ -414,8 +445,7 @@ class TestJSONParsingEdgeCases:
     
     def setup_method(self):
         """Setup for each test"""
-        with patch('src.namecard.infrastructure.ai.card_processor.genai'):
-            self.processor = CardProcessor()
+        self.processor = CardProcessor()
     
     def test_markdown_cleanup(self):
         """Test removal of markdown code blocks"""
@@ -486,6 +516,27 @@ class TestJSONParsingEdgeCases:
         
         assert len(cards) == 0
     
+    @pytest.mark.parametrize("response", [None, "", "   "])
+    def test_empty_response_short_circuits(self, response):
+        """Test empty or non-string responses fail fast without JSON parsing"""
+        with patch('src.namecard.infrastructure.ai.card_processor.orjson') as mock_orjson:
+            with pytest.raises(EmptyAIResponseError):
+                self.processor._parse_response(response, "test_user")
+        mock_orjson.loads.assert_not_called()
+    
+    def test_non_object_json_raises_parsing_error(self):
+        """Test valid JSON that is not an object is reported as a parsing error"""
+        with pytest.raises(JSONParsingError):
+            self.processor._parse_response("null", "test_user")
+    
+    def test_cards_not_a_list_returns_empty(self):
+        """Test a non-list cards value is skipped instead of iterated"""
+        with patch('src.namecard.infrastructure.ai.card_processor.logger') as mock_logger:
+            cards = self.processor._parse_response('{"cards": "not an array"}', "test_user")
+        
+        assert cards == []
+        mock_logger.error.assert_not_called()
+    
     def test_json_with_invalid_card_data(self):
         """Test JSON with card data that fails validation"""
         response = '''{
@@ -538,14 +589,30 @@ class TestJSONParsingEdgeCases:
         assert cards[0].name == "Valid User"
         assert cards[1].name == "Another Valid User"
 
+    
+    def test_rejected_cards_skip_model_construction(self):
+        """Test cards failing the cheap dict-level checks never reach BusinessCard"""
+        response = json.dumps({"cards": [
+            {"name": "Low Score", "phone": "0912345678", "confidence_score": 0.1, "quality_score": 0.9},
+            {"name": "No Contact", "company": "Corp", "confidence_score": 0.9, "quality_score": 0.9},
+            {"email": "nobody@example.com", "confidence_score": 0.9, "quality_score": 0.9},
+            {"name": "Valid", "phone": "0912345678", "confidence_score": 0.9, "quality_score": 0.9},
+        ]})
+        
+        with patch('src.namecard.infrastructure.ai.card_processor.BusinessCard',
+                   wraps=BusinessCard) as mock_card:
+            cards = self.processor._parse_response(response, "test_user")
+        
+        assert [c.name for c in cards] == ["Valid"]
+        assert mock_card.call_count == 1
+
 
 class TestCardQualityValidation:
     """Test comprehensive card quality validation scenarios"""
     
     def setup_method(self):
         """Setup for each test"""
-        with patch('src.namecard.infrastructure.ai.card_processor.genai'):
-            self.processor = CardProcessor()
+        self.processor = CardProcessor()
     
     def test_valid_card_with_name_and_phone(self):
         """Test valid card with name and phone"""
@@ -662,8 +729,7 @@ class TestProcessingSuggestions:
     
     def setup_method(self):
         """Setup for each test"""
-        with patch('src.namecard.infrastructure.ai.card_processor.genai'):
-            self.processor = CardProcessor()
+        self.processor = CardProcessor()
     
     def test_suggestions_for_no_cards(self):
         """Test suggestions when no cards are detected"""
@@ -738,8 +804,7 @@ class TestAPIRetryLogic:
     
     def setup_method(self):
         """Setup for each test"""
-        with patch('src.namecard.infrastructure.ai.card_processor.genai'):
-            self.processor = CardProcessor()
+        self.processor = CardProcessor()
     
     @patch('src.namecard.infrastructure.ai.card_processor.genai')
     def test_api_retry_on_failure(self, mock_genai):
@@ -808,16 +873,12 @@ class TestPerformanceScenarios:
     
     def setup_method(self):
         """Setup for each test"""
-        with patch('src.namecard.infrastructure.ai.card_processor.genai'):
-            self.processor = CardProcessor()
+        self.processor = CardProcessor()
     
-    def test_large_image_processing_performance(self):
+    def test_large_image_processing_performance(self, oversized_image):
         """Test processing of large images"""
-        # Create a large image
-        large_image = Image.new('RGB', (4000, 3000), color='white')
-        
         start_time = time.time()
-        processed = self.processor._preprocess_image(large_image)
+        processed = self.processor._preprocess_image(oversized_image)
         processing_time = time.time() - start_time
         
         # Should complete in reasonable time (less than 5 seconds)
@@ -5,19 +5,185 @@ Tests complete workflow scenarios end-to-end
 
 import pytest
 import json
+import orjson
 from unittest.mock import Mock, patch, MagicMock
 from PIL import Image
 import io
+from google.genai import types
 
-# Mock genai before importing to prevent initialization errors
-with patch('src.namecard.infrastructure.ai.card_processor.genai') as mock_genai:
-    mock_genai.configure.return_value = None
-    mock_model = Mock()
-    mock_model.generate_content.return_value = Mock(text='{"cards": []}')
-    mock_genai.GenerativeModel.return_value = mock_model
+# genai 已由 conftest 在整個測試階段 patch
+from src.namecard.infrastructure.ai.card_processor import CardProcessor, ProcessingConfig, APIError
+from src.namecard.core.models.card import BusinessCard
+from src.namecard.core.exceptions import EmptyAIResponseError, JSONParsingError
+
+# Gemini responses are fixed per scenario, so encode them once at import time
+_SINGLE_CARD_RESPONSE = orjson.dumps({
+    "cards": [{
+        "name": "John Doe",
+        "company": "Tech Company Inc.",
+        "title": "Software Engineer",
+        "phone": "+1-555-123-4567",
+        "email": "john.doe@techcompany.com",
+        "address": "123 Tech Street, Silicon Valley, CA 94000",
+        "website": "https://techcompany.com",
+        "fax": "+1-555-123-4568",
+        "line_id": "johndoe_tech",
+        "confidence_score": 0.95,
+        "quality_score": 0.9
+    }],
+    "total_cards_detected": 1,
+    "overall_quality": 0.9,
+    "processing_notes": "High quality business card with all information clearly visible"
+}).decode()
+
+_SIMPLE_CARD_RESPONSE = orjson.dumps({
+    "cards": [{
+        "name": "Test User",
+        "company": "Test Corp",
+        "phone": "123-456-7890",
+        "confidence_score": 0.9,
+        "quality_score": 0.8
+    }]
+}).decode()
+
+_MULTIPLE_CARDS_RESPONSE = orjson.dumps({
+    "cards": [
+        {
+            "name": "Alice Smith",
+            "company": "Design Studio",
+            "title": "Creative Director",
+            "phone": "+1-555-111-2222",
+            "email": "alice@designstudio.com",
+            "confidence_score": 0.92,
+            "quality_score": 0.88
+        },
+        {
+            "name": "Bob Johnson",
+            "company": "Marketing Agency",
+            "title": "Account Manager",
+            "phone": "+1-555-333-4444",
+            "email": "bob@marketingagency.com",
+            "confidence_score": 0.89,
+            "quality_score": 0.85
+        }
+    ],
+    "total_cards_detected": 2,
+    "overall_quality": 0.87,
+    "processing_notes": "Two business cards detected with good quality"
+}).decode()
+
+_MIXED_QUALITY_RESPONSE = orjson.dumps({
+    "cards": [
+        {
+            "name": "Good Quality Card",
+            "company": "Quality Corp",
+            "phone": "+1-555-999-8888",
+            "confidence_score": 0.95,
+            "quality_score": 0.9
+        },
+        {
+            "name": "Low Confidence Card",
+            "company": "Unclear Corp",
+            "phone": "+1-555-777-6666",
+            "confidence_score": 0.2,  # Below threshold
+            "quality_score": 0.9
+        },
+        {
+            "name": "Low Quality Card",
+            "company": "Blurry Corp",
+            "phone": "+1-555-555-4444",
+            "confidence_score": 0.9,
+            "quality_score": 0.1  # Below threshold
+        }
+    ],
+    "total_cards_detected": 3,
+    "overall_quality": 0.6
+}).decode()
+
+_INCOMPLETE_CARDS_RESPONSE = orjson.dumps({
+    "cards": [
+        {
+            "name": "Complete Card",
+            "company": "Complete Corp",
+            "phone": "+1-555-123-4567",
+            "confidence_score": 0.9,
+            "quality_score": 0.8
+        },
+        {
+            "confidence_score": 0.9,  # Missing name and company
+            "quality_score": 0.8
+        },
+        {
+            "name": "Contact Missing",
+            "company": "No Contact Corp",
+            "confidence_score": 0.9,
+            "quality_score": 0.8
+            # Missing all contact information
+        }
+    ]
+}).decode()
+
+_BORDERLINE_CARD_RESPONSE = orjson.dumps({
+    "cards": [{
+        "name": "Borderline Quality",
+        "company": "Borderline Corp",
+        "phone": "123-456-7890",
+        "confidence_score": 0.75,  # Below strict threshold
+        "quality_score": 0.65      # Below strict threshold
+    }]
+}).decode()
+
+_EDGE_CASE_CARDS_RESPONSE = orjson.dumps({
+    "cards": [
+        {
+            "name": "Unicode 测试用户",
+            "company": "国际公司 International Corp",
+            "title": "软件工程师 / Software Engineer",
+            "phone": "+86-138-0013-8000",
+            "email": "unicode.test@国际.com",
+            "address": "北京市朝阳区 / Beijing Chaoyang District",
+            "confidence_score": 0.9,
+            "quality_score": 0.8
+        },
+        {
+            "name": "Special-Chars",
+            "company": "O'Reilly & Co.",
+            "title": "VP of R&D",
+            "phone": "+1-555-123-4567 ext. 890",
+            "email": "special@o-reilly.co.uk",
+            "website": "https://www.o-reilly.co.uk/special-chars",
+            "confidence_score": 0.85,
+            "quality_score": 0.82
+        }
+    ]
+}).decode()
+
+
+@pytest.fixture(scope="session")
+def image_bytes_factory():
+    """Build encoded test images once per (width, height, format) and reuse the bytes"""
+    cache = {}
     
-    from src.namecard.infrastructure.ai.card_processor import CardProcessor, ProcessingConfig
-    from src.namecard.core.models.card import BusinessCard
+    def make(width=800, height=600, format='JPEG'):
+        key = (width, height, format)
+        if key not in cache:
+            # Gemini is mocked, so a blank canvas is enough; no text needs to be drawn
+            image = Image.new('RGB', (width, height), color='white')
+            img_byte_arr = io.BytesIO()
+            save_kwargs = {'quality': 85} if format == 'JPEG' else {}
+            image.save(img_byte_arr, format=format, **save_kwargs)
+            cache[key] = img_byte_arr.getvalue()
+        return cache[key]
+    
+    return make
+
+
+@pytest.fixture(scope="session")
+def minimal_image_bytes():
+    """Smallest image that clears the 300x300 resolution gate, for tests that treat the bytes as opaque"""
+    img_byte_arr = io.BytesIO()
+    Image.new('RGB', (300, 300), color='white').save(img_byte_arr, format='JPEG', quality=1)
+    return img_byte_arr.getvalue()
 
 
 class TestCardProcessorIntegration:
@@ -25,59 +191,16 @@ class TestCardProcessorIntegration:
     
     def setup_method(self):
         """Setup for each test"""
-        with patch('src.namecard.infrastructure.ai.card_processor.genai'):
-            self.processor = CardProcessor()
-            self.test_user_id = "integration_test_user"
-    
-    def create_test_image_bytes(self, width=800, height=600, format='PNG'):
-        """Create test image as bytes"""
-        image = Image.new('RGB', (width, height), color='white')
-        
-        # Add some simple content to make it look like a business card
-        from PIL import ImageDraw
-        draw = ImageDraw.Draw(image)
-        
-        # Simulate business card text
-        try:
-            draw.text((50, 50), "John Doe", fill='black')
-            draw.text((50, 100), "Software Engineer", fill='black')
-            draw.text((50, 150), "Tech Company Inc.", fill='black')
-            draw.text((50, 200), "john.doe@techcompany.com", fill='black')
-            draw.text((50, 250), "+1-555-123-4567", fill='black')
-        except:
-            # If font issues, just create plain image
-            pass
-        
-        img_byte_arr = io.BytesIO()
-        image.save(img_byte_arr, format=format)
-        return img_byte_arr.getvalue()
+        self.processor = CardProcessor()
+        self.test_user_id = "integration_test_user"
     
     @patch.object(CardProcessor, '_analyze_with_gemini')
-    def test_single_card_complete_workflow(self, mock_analyze):
+    def test_single_card_complete_workflow(self, mock_analyze, image_bytes_factory):
         """Test complete workflow for single business card"""
-        # Mock Gemini response with complete card data
-        gemini_response = {
-            "cards": [{
-                "name": "John Doe",
-                "company": "Tech Company Inc.",
-                "title": "Software Engineer",
-                "phone": "+1-555-123-4567",
-                "email": "john.doe@techcompany.com",
-                "address": "123 Tech Street, Silicon Valley, CA 94000",
-                "website": "https://techcompany.com",
-                "fax": "+1-555-123-4568",
-                "line_id": "johndoe_tech",
-                "confidence_score": 0.95,
-                "quality_score": 0.9
-            }],
-            "total_cards_detected": 1,
-            "overall_quality": 0.9,
-            "processing_notes": "High quality business card with all information clearly visible"
-        }
-        mock_analyze.return_value = json.dumps(gemini_response)
+        mock_analyze.return_value = _SINGLE_CARD_RESPONSE
         
         # Create test image
-        image_data = self.create_test_image_bytes()
+        image_data = image_bytes_factory()
         
         # Process the image
         cards = self.processor.process_image(image_data, self.test_user_id)
@@ -103,37 +226,58 @@ class TestCardProcessorIntegration:
         mock_analyze.assert_called_once()
     
     @patch.object(CardProcessor, '_analyze_with_gemini')
-    def test_multiple_cards_workflow(self, mock_analyze):
+    def test_gemini_result_cached_on_repeat_image(self, mock_analyze, image_bytes_factory):
+        """Test re-uploading identical image bytes reuses the cached Gemini response"""
+        mock_analyze.return_value = _SIMPLE_CARD_RESPONSE
+        
+        image_data = image_bytes_factory()
+        first = self.processor.process_image(image_data, self.test_user_id)
+        second = self.processor.process_image(image_data, "another_user")
+        
+        assert mock_analyze.call_count == 1
+        assert first[0].name == second[0].name == "Test User"
+        assert second[0].line_user_id == "another_user"
+        
+        # Different bytes must still go to Gemini
+        self.processor.process_image(image_bytes_factory(width=900), self.test_user_id)
+        assert mock_analyze.call_count == 2
+    
+    @patch.object(CardProcessor, '_analyze_with_gemini')
+    def test_gemini_cache_skips_fallback_responses(self, mock_analyze, image_bytes_factory):
+        """Test fallback-model responses are not reused as primary-model results"""
+        def answer_with_fallback(image):
+            self.processor._thread_state.fallback_model = "gemini-2.5-flash-lite"
+            return _SIMPLE_CARD_RESPONSE
+        mock_analyze.side_effect = answer_with_fallback
+        
+        image_data = image_bytes_factory()
+        self.processor.process_image(image_data, self.test_user_id)
+        self.processor.process_image(image_data, self.test_user_id)
+        
+        assert mock_analyze.call_count == 2
+        assert len(self.processor._response_cache) == 0
+    
+    @patch.object(CardProcessor, '_analyze_with_gemini')
+    def test_gemini_cache_evicts_least_recently_used(self, mock_analyze, image_bytes_factory):
+        """Test the response cache stays within its size limit"""
+        mock_analyze.return_value = _SIMPLE_CARD_RESPONSE
+        self.processor.RESPONSE_CACHE_SIZE = 1
+        
+        first_image = image_bytes_factory()
+        self.processor.process_image(first_image, self.test_user_id)
+        self.processor.process_image(image_bytes_factory(width=900), self.test_user_id)
+        self.processor.process_image(first_image, self.test_user_id)
+        
+        assert mock_analyze.call_count == 3
+        assert len(self.processor._response_cache) == 1
+    
+    @patch.object(CardProcessor, '_analyze_with_gemini')
+    def test_multiple_cards_workflow(self, mock_analyze, image_bytes_factory):
         """Test workflow with multiple business cards in one image"""
-        gemini_response = {
-            "cards": [
-                {
-                    "name": "Alice Smith",
-                    "company": "Design Studio",
-                    "title": "Creative Director",
-                    "phone": "+1-555-111-2222",
-                    "email": "alice@designstudio.com",
-                    "confidence_score": 0.92,
-                    "quality_score": 0.88
-                },
-                {
-                    "name": "Bob Johnson",
-                    "company": "Marketing Agency",
-                    "title": "Account Manager",
-                    "phone": "+1-555-333-4444",
-                    "email": "bob@marketingagency.com",
-                    "confidence_score": 0.89,
-                    "quality_score": 0.85
-                }
-            ],
-            "total_cards_detected": 2,
-            "overall_quality": 0.87,
-            "processing_notes": "Two business cards detected with good quality"
-        }
-        mock_analyze.return_value = json.dumps(gemini_response)
+        mock_analyze.return_value = _MULTIPLE_CARDS_RESPONSE
         
         # Create larger test image to simulate multiple cards
-        image_data = self.create_test_image_bytes(width=1600, height=800)
+        image_data = image_bytes_factory(width=1600, height=800)
         
         cards = self.processor.process_image(image_data, self.test_user_id)
         
@@ -150,38 +294,11 @@ class TestCardProcessorIntegration:
         assert cards[1].line_user_id == self.test_user_id
     
     @patch.object(CardProcessor, '_analyze_with_gemini')
-    def test_low_quality_cards_filtered_out(self, mock_analyze):
+    def test_low_quality_cards_filtered_out(self, mock_analyze, minimal_image_bytes):
         """Test that low quality cards are filtered out"""
-        gemini_response = {
-            "cards": [
-                {
-                    "name": "Good Quality Card",
-                    "company": "Quality Corp",
-                    "phone": "+1-555-999-8888",
-                    "confidence_score": 0.95,
-                    "quality_score": 0.9
-                },
-                {
-                    "name": "Low Confidence Card",
-                    "company": "Unclear Corp",
-                    "phone": "+1-555-777-6666",
-                    "confidence_score": 0.2,  # Below threshold
-                    "quality_score": 0.9
-                },
-                {
-                    "name": "Low Quality Card",
-                    "company": "Blurry Corp",
-                    "phone": "+1-555-555-4444",
-                    "confidence_score": 0.9,
-                    "quality_score": 0.1  # Below threshold
-                }
-            ],
-            "total_cards_detected": 3,
-            "overall_quality": 0.6
-        }
-        mock_analyze.return_value = json.dumps(gemini_response)
+        mock_analyze.return_value = _MIXED_QUALITY_RESPONSE
         
-        image_data = self.create_test_image_bytes()
+        image_data = minimal_image_bytes
         cards = self.processor.process_image(image_data, self.test_user_id)
         
         # Only high quality card should pass validation
@@ -189,73 +306,41 @@ class TestCardProcessorIntegration:
         assert cards[0].name == "Good Quality Card"
     
     @patch.object(CardProcessor, '_analyze_with_gemini')
-    def test_incomplete_cards_filtered_out(self, mock_analyze):
+    def test_incomplete_cards_filtered_out(self, mock_analyze, minimal_image_bytes):
         """Test that cards missing essential information are filtered"""
-        gemini_response = {
-            "cards": [
-                {
-                    "name": "Complete Card",
-                    "company": "Complete Corp",
-                    "phone": "+1-555-123-4567",
-                    "confidence_score": 0.9,
-                    "quality_score": 0.8
-                },
-                {
-                    "confidence_score": 0.9,  # Missing name and company
-                    "quality_score": 0.8
-                },
-                {
-                    "name": "Contact Missing",
-                    "company": "No Contact Corp",
-                    "confidence_score": 0.9,
-                    "quality_score": 0.8
-                    # Missing all contact information
-                }
-            ]
-        }
-        mock_analyze.return_value = json.dumps(gemini_response)
+        mock_analyze.return_value = _INCOMPLETE_CARDS_RESPONSE
         
-        image_data = self.create_test_image_bytes()
+        image_data = minimal_image_bytes
         cards = self.processor.process_image(image_data, self.test_user_id)
         
         # Only complete card should pass validation
         assert len(cards) == 1
         assert cards[0].name == "Complete Card"
     
+    @pytest.mark.parametrize("response,expected_error", [
+        ("Not JSON at all", JSONParsingError),
+        ('{"invalid": json syntax}', JSONParsingError),
+        ('{"cards": "not an array"}', EmptyAIResponseError),
+        ('{"cards": [{"invalid_card": true}]}', EmptyAIResponseError),
+        ("", EmptyAIResponseError),
+        (None, EmptyAIResponseError)
+    ])
     @patch.object(CardProcessor, '_analyze_with_gemini')
-    def test_malformed_gemini_response_handling(self, mock_analyze):
-        """Test handling of malformed Gemini responses"""
-        malformed_responses = [
-            "Not JSON at all",
-            '{"invalid": json syntax}',
-            '{"cards": "not an array"}',
-            '{"cards": [{"invalid_card": true}]}',
-            "",
-            None
-        ]
-        
-        image_data = self.create_test_image_bytes()
+    def test_malformed_gemini_response_handling(self, mock_analyze, minimal_image_bytes,
+                                                response, expected_error):
+        """Malformed Gemini responses surface as typed AI errors instead of cards"""
+        mock_analyze.return_value = response
         
-        for response in malformed_responses:
-            mock_analyze.return_value = response
-            cards = self.processor.process_image(image_data, self.test_user_id)
-            assert len(cards) == 0, f"Should return empty list for response: {response}"
+        with pytest.raises(expected_error):
+            self.processor.process_image(minimal_image_bytes, self.test_user_id)
     
     @patch.object(CardProcessor, '_analyze_with_gemini')
-    def test_image_preprocessing_integration(self, mock_analyze):
+    def test_image_preprocessing_integration(self, mock_analyze, image_bytes_factory):
         """Test that image preprocessing works correctly in full workflow"""
-        mock_analyze.return_value = json.dumps({
-            "cards": [{
-                "name": "Test User",
-                "company": "Test Corp",
-                "phone": "123-456-7890",
-                "confidence_score": 0.9,
-                "quality_score": 0.8
-            }]
-        })
+        mock_analyze.return_value = _SIMPLE_CARD_RESPONSE
         
         # Test with oversized image
-        large_image_data = self.create_test_image_bytes(width=4000, height=3000)
+        large_image_data = image_bytes_factory(width=4000, height=3000)
         
         cards = self.processor.process_image(large_image_data, self.test_user_id)
         
@@ -273,26 +358,31 @@ class TestCardProcessorIntegration:
         assert processed_image.size[1] <= 1920
     
     @patch.object(CardProcessor, '_analyze_with_gemini')
-    def test_different_image_formats_workflow(self, mock_analyze):
+    def test_process_image_accepts_bytesio_stream(self, mock_analyze):
+        """Test an encoded BytesIO can be passed straight through without getvalue()"""
+        mock_analyze.return_value = _SIMPLE_CARD_RESPONSE
+        
+        img_byte_arr = io.BytesIO()
+        Image.new('RGB', (800, 600), color='white').save(img_byte_arr, format='JPEG')
+        
+        # Stream is left positioned at the end after save()
+        cards = self.processor.process_image(img_byte_arr, self.test_user_id)
+        
+        assert len(cards) == 1
+        assert cards[0].name == "Test User"
+        mock_analyze.assert_called_once()
+    
+    @pytest.mark.parametrize("fmt", ['PNG', 'JPEG'])
+    @patch.object(CardProcessor, '_analyze_with_gemini')
+    def test_different_image_formats_workflow(self, mock_analyze, image_bytes_factory, fmt):
         """Test workflow with different image formats"""
-        mock_analyze.return_value = json.dumps({
-            "cards": [{
-                "name": "Format Test User",
-                "company": "Format Corp",
-                "phone": "123-456-7890",
-                "confidence_score": 0.9,
-                "quality_score": 0.8
-            }]
-        })
-        
-        formats = ['PNG', 'JPEG']
-        
-        for fmt in formats:
-            image_data = self.create_test_image_bytes(format=fmt)
-            cards = self.processor.process_image(image_data, self.test_user_id)
-            
-            assert len(cards) == 1
-            assert cards[0].name == "Format Test User"
+        mock_analyze.return_value = _SIMPLE_CARD_RESPONSE
+        
+        image_data = image_bytes_factory(format=fmt)
+        cards = self.processor.process_image(image_data, self.test_user_id)
+        
+        assert len(cards) == 1
+        assert cards[0].name == "Test User"
     
     def test_processing_suggestions_integration(self):
         """Test processing suggestions with realistic scenarios"""
@@ -333,19 +423,19 @@ class TestCardProcessorIntegration:
         assert any("資訊不完整" in s for s in suggestions)
     
     @patch.object(CardProcessor, '_analyze_with_gemini')
-    def test_error_recovery_workflow(self, mock_analyze):
+    def test_error_recovery_workflow(self, mock_analyze, minimal_image_bytes):
         """Test error recovery in complete workflow"""
         # First call fails, should return empty list gracefully
         mock_analyze.side_effect = Exception("Gemini API temporarily unavailable")
         
-        image_data = self.create_test_image_bytes()
+        image_data = minimal_image_bytes
         
         # Should not raise exception, should return empty list
         cards = self.processor.process_image(image_data, self.test_user_id)
         assert len(cards) == 0
     
     @patch.object(CardProcessor, '_analyze_with_gemini')
-    def test_custom_config_integration(self, mock_analyze):
+    def test_custom_config_integration(self, mock_analyze, minimal_image_bytes):
         """Test workflow with custom configuration"""
         # Create processor with stricter thresholds
         strict_config = ProcessingConfig(
@@ -354,56 +444,24 @@ class TestCardProcessorIntegration:
             max_image_size=(1024, 1024)
         )
         
-        with patch('src.namecard.infrastructure.ai.card_processor.genai'):
-            strict_processor = CardProcessor(config=strict_config)
+        strict_processor = CardProcessor(config=strict_config)
         
         # Mock response with card that would pass default thresholds but not strict ones
-        mock_analyze.return_value = json.dumps({
-            "cards": [{
-                "name": "Borderline Quality",
-                "company": "Borderline Corp",
-                "phone": "123-456-7890",
-                "confidence_score": 0.75,  # Below strict threshold
-                "quality_score": 0.65      # Below strict threshold
-            }]
-        })
-        
-        image_data = self.create_test_image_bytes()
+        mock_analyze.return_value = _BORDERLINE_CARD_RESPONSE
+        
+        image_data = minimal_image_bytes
         cards = strict_processor.process_image(image_data, self.test_user_id)
         
         # Should be filtered out due to strict thresholds
         assert len(cards) == 0
     
     @patch.object(CardProcessor, '_analyze_with_gemini')
-    def test_edge_case_card_data_integration(self, mock_analyze):
+    def test_edge_case_card_data_integration(self, mock_analyze, minimal_image_bytes):
         """Test workflow with edge case card data"""
         # Test with various edge cases in card data
-        mock_analyze.return_value = json.dumps({
-            "cards": [
-                {
-                    "name": "Unicode 测试用户",
-                    "company": "国际公司 International Corp",
-                    "title": "软件工程师 / Software Engineer",
-                    "phone": "+86-138-0013-8000",
-                    "email": "unicode.test@国际.com",
-                    "address": "北京市朝阳区 / Beijing Chaoyang District",
-                    "confidence_score": 0.9,
-                    "quality_score": 0.8
-                },
-                {
-                    "name": "Special-Chars",
-                    "company": "O'Reilly & Co.",
-                    "title": "VP of R&D",
-                    "phone": "+1-555-123-4567 ext. 890",
-                    "email": "special@o-reilly.co.uk",
-                    "website": "https://www.o-reilly.co.uk/special-chars",
-                    "confidence_score": 0.85,
-                    "quality_score": 0.82
-                }
-            ]
-        })
-        
-        image_data = self.create_test_image_bytes()
+        mock_analyze.return_value = _EDGE_CASE_CARDS_RESPONSE
+        
+        image_data = minimal_image_bytes
         cards = self.processor.process_image(image_data, self.test_user_id)
         
         assert len(cards) == 2
@@ -416,4 +474,104 @@ class TestCardProcessorIntegration:
         # Verify special characters handling
         assert cards[1].name == "Special-Chars"
         assert "O'Reilly & Co." == cards[1].company
-        assert "VP of R&D" == cards[1].title
\ No newline at end of file
+        assert "VP of R&D" == cards[1].title
+
+class TestBatchProcessing:
+    """Integration tests for Gemini Batch Mode submission and polling"""
+    
+    def setup_method(self):
+        """Setup for each test"""
+        self.processor = CardProcessor()
+        self.processor.client = Mock()
+        self.test_user_id = "batch_test_user"
+    
+    def build_batch_output(self, entries):
+        """Build JSONL batch output bytes from (key, card list or error) pairs"""
+        lines = []
+        for key, payload in entries:
+            if isinstance(payload, dict):
+                lines.append(json.dumps({"key": key, "error": payload}))
+            else:
+                text = json.dumps({"cards": payload})
+                lines.append(json.dumps({
+                    "key": key,
+                    "response": {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+                }))
+        return "\n".join(lines).encode('utf-8')
+    
+    def test_submit_batch_uploads_jsonl_and_creates_job(self, image_bytes_factory):
+        """Test batch submission packages every image into one JSONL upload"""
+        # Mock's name kwarg is reserved, so set it after construction
+        self.processor.client.files.upload.return_value.name = "files/abc"
+        self.processor.client.batches.create.return_value.name = "batches/123"
+        
+        images = [image_bytes_factory(), image_bytes_factory(1000, 800)]
+        batch_name = self.processor.submit_batch(images, self.test_user_id)
+        
+        assert batch_name == "batches/123"
+        self.processor.client.models.generate_content.assert_not_called()
+        
+        upload_kwargs = self.processor.client.files.upload.call_args.kwargs
+        requests = [json.loads(line) for line in upload_kwargs['file'].getvalue().decode('utf-8').splitlines()]
+        assert [r["key"] for r in requests] == ["batch_test_user-0", "batch_test_user-1"]
+        parts = requests[0]["request"]["contents"][0]["parts"]
+        assert parts[0]["text"] == self.processor.card_prompt
+        assert parts[1]["inline_data"]["mime_type"] == "image/png"
+        
+        create_kwargs = self.processor.client.batches.create.call_args.kwargs
+        assert create_kwargs['model'] == "gemini-2.5-flash"
+        assert create_kwargs['src'] == "files/abc"
+    
+    def test_poll_batch_pending_returns_none(self):
+        """Test polling a running batch job returns None"""
+        self.processor.client.batches.get.return_value = Mock(state=types.JobState.JOB_STATE_RUNNING)
+        
+        assert self.processor.poll_batch("batches/123", self.test_user_id, 2) is None
+        self.processor.client.files.download.assert_not_called()
+    
+    def test_poll_batch_parses_results_in_submission_order(self):
+        """Test completed batch results are parsed per image in key order"""
+        valid_card = {
+            "name": "Batch User",
+            "company": "Batch Corp",
+            "phone": "123-456-7890",
+            "confidence_score": 0.9,
+            "quality_score": 0.8
+        }
+        self.processor.client.batches.get.return_value = Mock(
+            state=types.JobState.JOB_STATE_SUCCEEDED,
+            dest=Mock(file_name="files/result")
+        )
+        self.processor.client.files.download.return_value = self.build_batch_output([
+            ("batch_test_user-2", {"code": 400, "message": "bad image"}),
+            ("batch_test_user-0", [valid_card]),
+            ("batch_test_user-1", []),
+        ])
+        
+        results = self.processor.poll_batch("batches/123", self.test_user_id, 3)
+        
+        assert [len(cards) for cards in results] == [1, 0, 0]
+        assert results[0][0].name == "Batch User"
+        assert results[0][0].line_user_id == self.test_user_id
+        self.processor.client.files.download.assert_called_once_with(file="files/result")
+    
+    def test_poll_batch_returns_one_entry_per_submitted_image(self):
+        """Test images missing from the batch output still get an empty entry"""
+        self.processor.client.batches.get.return_value = Mock(
+            state=types.JobState.JOB_STATE_SUCCEEDED,
+            dest=Mock(file_name="files/result")
+        )
+        self.processor.client.files.download.return_value = self.build_batch_output([
+            ("batch_test_user-0", []),
+        ])
+        
+        results = self.processor.poll_batch("batches/123", self.test_user_id, 3)
+        
+        assert results == [[], [], []]
+    
+    def test_poll_batch_failed_job_raises(self):
+        """Test a failed batch job surfaces as APIError"""
+        self.processor.client.batches.get.return_value = Mock(state=types.JobState.JOB_STATE_FAILED)
+        
+        with pytest.raises(APIError, match="JOB_STATE_FAILED"):
+            self.processor.poll_batch("batches/123", self.test_user_id, 2)
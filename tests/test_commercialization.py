@@ -10,19 +10,35 @@ Tests cover:
 """
 
 import pytest
-import tempfile
-import os
+import shutil
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+from src.namecard.core.services.quota_service import QuotaService
+from src.namecard.core.services.subscription_service import SubscriptionService
+from src.namecard.infrastructure.storage.tenant_db import TenantDatabase
 
-@pytest.fixture
-def test_db():
-    """Create a temporary test database"""
-    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as f:
-        db_path = f.name
+
+# Quota reset date that consume_scan treats as "already reset this month"
+CURRENT_MONTH_FIRST = datetime.now().strftime("%Y-%m-01")
+
+
+class UnsyncedTenantDatabase(TenantDatabase):
+    """TenantDatabase that skips fsync on commit; test files are thrown away anyway"""
     
-    from src.namecard.infrastructure.storage.tenant_db import TenantDatabase
-    db = TenantDatabase(db_path)
+    @contextmanager
+    def get_connection(self):
+        with super().get_connection() as conn:
+            # synchronous is per-connection, and services open one per call
+            conn.execute("PRAGMA synchronous=OFF")
+            yield conn
+
+
+@pytest.fixture(scope="module")
+def template_db_path(tmp_path_factory):
+    """Build the schema and test tenant once per module"""
+    db_path = str(tmp_path_factory.mktemp("tenant_db") / "template.db")
+    db = UnsyncedTenantDatabase(db_path)
     
     # Create test tenant
     with db.get_connection() as conn:
@@ -34,23 +50,36 @@ def test_db():
                     'encrypted_token', 'encrypted_secret', 'encrypted_key', 'db_id')
         ''')
     
-    yield db
-    
-    # Cleanup
-    os.unlink(db_path)
+    return db_path
+
+
+@pytest.fixture
+def test_db(template_db_path, tmp_path):
+    """Give each test its own copy of the template database"""
+    db_path = str(tmp_path / "tenants.db")
+    # Services open a fresh connection per call, so isolate by file instead of by transaction
+    shutil.copyfile(template_db_path, db_path)
+    return UnsyncedTenantDatabase(db_path)
+
+
+def set_current_month_scans(db, tenant_id, scans):
+    """Preset this month's scan count, with the reset date pinned so consume_scan does not reset it"""
+    with db.get_connection() as conn:
+        conn.execute(
+            "UPDATE tenants SET current_month_scans = ?, quota_reset_date = ? WHERE id = ?",
+            (scans, CURRENT_MONTH_FIRST, tenant_id)
+        )
 
 
 @pytest.fixture
 def quota_service(test_db):
     """Create QuotaService with test database"""
-    from src.namecard.core.services.quota_service import QuotaService
     return QuotaService(test_db)
 
 
 @pytest.fixture
 def subscription_service(test_db):
     """Create SubscriptionService with test database"""
-    from src.namecard.core.services.subscription_service import SubscriptionService
     return SubscriptionService(test_db)
 
 
@@ -90,14 +119,7 @@ class TestQuotaService:
     
     def test_consume_scan_quota_exceeded(self, quota_service, test_db):
         """Test scan consumption when quota is exhausted"""
-        from datetime import datetime
-        # Set current scans to max AND set reset_date to current month to avoid reset
-        current_month = datetime.now().strftime("%Y-%m-01")
-        with test_db.get_connection() as conn:
-            conn.execute(
-                "UPDATE tenants SET current_month_scans = 50, quota_reset_date = ? WHERE id = ?",
-                (current_month, "test-tenant",)
-            )
+        set_current_month_scans(test_db, "test-tenant", 50)
         
         result = quota_service.consume_scan("test-tenant", 1)
         
@@ -224,6 +246,44 @@ class TestSubscriptionService:
         assert sub["user_limit"] == 50
         assert sub["update_available"] is False
     
+    def test_get_plan_served_from_cache(self, subscription_service, test_db):
+        """Test repeated plan lookups do not hit the database"""
+        subscription_service.get_plan("starter")
+        
+        # Change the row behind the service's back; the cached copy should still be returned
+        with test_db.get_connection() as conn:
+            conn.execute("UPDATE subscription_plans SET display_name = 'Changed' WHERE name = 'starter'")
+        
+        plan = subscription_service.get_plan("starter")
+        assert plan["display_name"] == "Starter"
+        
+        # Mutating a returned dict must not leak into the cache
+        plan["display_name"] = "Mutated"
+        assert subscription_service.get_plan("starter")["display_name"] == "Starter"
+    
+    def test_plan_cache_invalidated_on_new_version(self, subscription_service):
+        """Test creating a plan version refreshes cached plan lookups"""
+        assert subscription_service.get_plan("starter")["monthly_scan_quota"] == 500
+        subscription_service.list_plans()
+        
+        subscription_service.create_plan_version(plan_id="starter", monthly_scan_quota=1000)
+        
+        assert subscription_service.get_plan("starter")["monthly_scan_quota"] == 1000
+        starter = next(p for p in subscription_service.list_plans() if p["name"] == "starter")
+        assert starter["monthly_scan_quota"] == 1000
+    
+    def test_assign_plan_ignores_stale_cache(self, subscription_service, test_db):
+        """Test a new version created by another process is used for assignment"""
+        subscription_service.get_plan("starter")
+        
+        # Another worker process has its own service instance and cache
+        new_version = SubscriptionService(test_db).create_plan_version(
+            plan_id="starter", monthly_scan_quota=1000
+        )
+        
+        result = subscription_service.assign_plan("test-tenant", "starter", 1)
+        assert result["version_id"] == new_version["id"]
+    
     def test_update_plan_metadata(self, subscription_service):
         """Test updating plan display name and description"""
         result = subscription_service.update_plan(
@@ -288,35 +348,18 @@ class TestEdgeCases:
         assert result["success"] is False
         assert "not found" in result["message"].lower()
     
-    def test_consume_exactly_remaining_quota(self, quota_service, test_db):
-        """Test consuming exactly the remaining quota"""
-        from datetime import datetime
-        current_month = datetime.now().strftime("%Y-%m-01")
-        with test_db.get_connection() as conn:
-            conn.execute(
-                "UPDATE tenants SET current_month_scans = 49, quota_reset_date = ? WHERE id = ?",
-                (current_month, "test-tenant",)
-            )
+    @pytest.mark.parametrize("preset_scans,amount,ok,remaining", [
+        (49, 1, True, 0),     # exactly the remaining quota
+        (45, 10, False, 5),   # more than the 5 remaining
+    ])
+    def test_consume_near_quota_limit(self, quota_service, test_db, preset_scans, amount, ok, remaining):
+        """Test consuming up to and past the remaining monthly quota"""
+        set_current_month_scans(test_db, "test-tenant", preset_scans)
         
-        result = quota_service.consume_scan("test-tenant", 1)
+        result = quota_service.consume_scan("test-tenant", amount)
         
-        assert result["success"] is True
-        assert result["remaining_scans"] == 0
-    
-    def test_consume_more_than_remaining(self, quota_service, test_db):
-        """Test trying to consume more than remaining quota"""
-        from datetime import datetime
-        current_month = datetime.now().strftime("%Y-%m-01")
-        with test_db.get_connection() as conn:
-            conn.execute(
-                "UPDATE tenants SET current_month_scans = 45, quota_reset_date = ? WHERE id = ?",
-                (current_month, "test-tenant",)
-            )
-        
-        result = quota_service.consume_scan("test-tenant", 10)  # Only 5 remaining
-        
-        assert result["success"] is False
-        assert result["remaining_scans"] == 5
+        assert result["success"] is ok
+        assert result["remaining_scans"] == remaining
 
 
 if __name__ == "__main__":
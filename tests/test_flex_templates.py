@@ -16,7 +16,7 @@ from src.namecard.api.line_bot.flex_templates import (
 )
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def sample_card():
     """範例名片"""
     return BusinessCard(
@@ -39,7 +39,7 @@ def sample_card_minimal():
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def sample_batch_result():
     """範例批次結果"""
     return BatchProcessResult(
@@ -52,28 +52,43 @@ def sample_batch_result():
     )
 
 
+# 產生結果只讀不改，同一模組內共用一次建立的 bubble
+@pytest.fixture(scope="module")
+def card_bubble(sample_card):
+    """範例名片的結果卡片"""
+    return build_card_result_bubble(sample_card)
+
+
+@pytest.fixture(scope="module")
+def multi_card_summary_bubble():
+    """5 張名片的摘要卡片"""
+    return build_multi_card_summary_bubble(total=5)
+
+
+@pytest.fixture(scope="module")
+def batch_complete_bubble(sample_batch_result):
+    """範例批次的完成卡片"""
+    return build_batch_complete_bubble(sample_batch_result)
+
+
 class TestBuildCardResultBubble:
     """測試單張名片卡片建立"""
 
-    def test_returns_bubble_container(self, sample_card):
+    def test_returns_bubble_container(self, card_bubble):
         """應回傳 BubbleContainer"""
-        result = build_card_result_bubble(sample_card)
-        assert isinstance(result, BubbleContainer)
+        assert isinstance(card_bubble, BubbleContainer)
 
-    def test_includes_header(self, sample_card):
+    def test_includes_header(self, card_bubble):
         """應包含 header"""
-        result = build_card_result_bubble(sample_card)
-        assert result.header is not None
+        assert card_bubble.header is not None
 
-    def test_includes_body(self, sample_card):
+    def test_includes_body(self, card_bubble):
         """應包含 body"""
-        result = build_card_result_bubble(sample_card)
-        assert result.body is not None
+        assert card_bubble.body is not None
 
-    def test_includes_footer(self, sample_card):
+    def test_includes_footer(self, card_bubble):
         """應包含 footer"""
-        result = build_card_result_bubble(sample_card)
-        assert result.footer is not None
+        assert card_bubble.footer is not None
 
     def test_handles_minimal_card(self, sample_card_minimal):
         """應能處理只有姓名的名片"""
@@ -84,29 +99,25 @@ class TestBuildCardResultBubble:
 class TestBuildMultiCardSummaryBubble:
     """測試多張名片摘要卡片建立"""
 
-    def test_returns_bubble_container(self):
+    def test_returns_bubble_container(self, multi_card_summary_bubble):
         """應回傳 BubbleContainer"""
-        result = build_multi_card_summary_bubble(total=5)
-        assert isinstance(result, BubbleContainer)
+        assert isinstance(multi_card_summary_bubble, BubbleContainer)
 
-    def test_size_is_kilo(self):
+    def test_size_is_kilo(self, multi_card_summary_bubble):
         """應使用 kilo 尺寸"""
-        result = build_multi_card_summary_bubble(total=5)
-        assert result.size == "kilo"
+        assert multi_card_summary_bubble.size == "kilo"
 
 
 class TestBuildBatchCompleteBubble:
     """測試批次完成卡片建立"""
 
-    def test_returns_bubble_container(self, sample_batch_result):
+    def test_returns_bubble_container(self, batch_complete_bubble):
         """應回傳 BubbleContainer"""
-        result = build_batch_complete_bubble(sample_batch_result)
-        assert isinstance(result, BubbleContainer)
+        assert isinstance(batch_complete_bubble, BubbleContainer)
 
-    def test_size_is_kilo(self, sample_batch_result):
+    def test_size_is_kilo(self, batch_complete_bubble):
         """應使用 kilo 尺寸"""
-        result = build_batch_complete_bubble(sample_batch_result)
-        assert result.size == "kilo"
+        assert batch_complete_bubble.size == "kilo"
 
 
 class TestCreateCardResultMessage:
@@ -15,13 +15,112 @@ LINE 圖片上傳 → 下載圖片 → AI 辨識 → Notion 儲存 → ImgBB 上
 """
 
 import pytest
-from unittest.mock import Mock, patch, MagicMock, PropertyMock
+from unittest.mock import Mock, patch
 from io import BytesIO
+from types import SimpleNamespace
 from PIL import Image
-import json
+
+from linebot import LineBotApi
+from linebot.exceptions import LineBotApiError
 
 from src.namecard.core.models.card import BusinessCard
+from src.namecard.core.exceptions import EmptyAIResponseError, APIQuotaExceededError
+from src.namecard.infrastructure.ai.card_processor import CardProcessor
 from src.namecard.api.line_bot.event_handler import UnifiedEventHandler
+from src.namecard.infrastructure.storage.notion_client import NotionClient
+
+
+def _create_test_image() -> bytes:
+    """創建測試用圖片（BMP 不壓縮，省去 PNG 的 DEFLATE 編碼）"""
+    img = Image.new('RGB', (32, 32), color='white')
+    buffer = BytesIO()
+    img.save(buffer, format='BMP')
+    return buffer.getvalue()
+
+
+# 圖片 bytes 只會被傳給 mock，不會被解碼，整個模組共用同一份編碼結果
+TEST_IMAGE_DATA = _create_test_image()
+
+# 測試用名片只驗證一次；需要修改時以 model_copy() 複製，不重跑驗證器
+CANONICAL_CARD = BusinessCard(
+    name="張三",
+    company="測試公司",
+    title="工程師",
+    phone="02-1234-5678",
+    email="test@example.com",
+    confidence_score=0.95,
+    quality_score=0.9,
+    line_user_id="U1234567890abcdef"
+)
+
+# LINE API 500 錯誤，只建立一次供錯誤處理測試重複使用
+LINE_API_SERVER_ERROR = LineBotApiError(
+    status_code=500,
+    headers={},
+    request_id="req123",
+    error=SimpleNamespace(message="Server error")
+)
+
+
+@pytest.fixture
+def services(monkeypatch):
+    """以 monkeypatch 替換 event_handler 使用的模組層級服務，測試結束自動還原"""
+    services = SimpleNamespace(security=Mock(), user_service=Mock(), submit_upload=Mock())
+    monkeypatch.setattr('src.namecard.api.line_bot.event_handler.security_service', services.security)
+    monkeypatch.setattr('src.namecard.api.line_bot.event_handler.user_service', services.user_service)
+    monkeypatch.setattr('src.namecard.api.line_bot.event_handler.submit_image_upload', services.submit_upload)
+    return services
+
+
+@pytest.fixture
+def handler_env(services):
+    """
+    已接好 mocks 的 UnifiedEventHandler 測試環境
+    
+    預設為成功流程：用戶未封鎖、圖片有效、AI 辨識出一張名片、Notion 儲存成功；
+    各測試只覆寫需要改變的部分。
+    """
+    services.security.is_user_blocked.return_value = False
+    services.security.validate_image_data.return_value = True
+    
+    status = services.user_service.get_user_status.return_value
+    status.daily_usage = 10
+    status.is_batch_mode = False
+    status.current_batch = None
+    
+    # 以真實類別作為 spec，拼錯的方法名稱會直接拋出 AttributeError
+    # Mock LINE Bot API
+    line_api = Mock(spec=LineBotApi)
+    line_api.get_message_content.return_value.content = TEST_IMAGE_DATA
+    
+    # Mock Card Processor（handler 會修改 card.processed，每個測試各用一份副本）
+    card = CANONICAL_CARD.model_copy()
+    processor = Mock(spec=CardProcessor)
+    processor.process_image.return_value = [card]
+    
+    # Mock Notion Client
+    notion = Mock(spec=NotionClient)
+    notion.database_id = "test_db_id"
+    notion.data_source_id = "test_ds_id"
+    notion.save_business_card.return_value = ("page_123", "https://notion.so/page_123")
+    
+    handler = UnifiedEventHandler(
+        line_bot_api=line_api,
+        card_processor=processor,
+        notion_client=notion,
+    )
+    
+    return SimpleNamespace(
+        security=services.security,
+        user_service=services.user_service,
+        submit_upload=services.submit_upload,
+        status=status,
+        line_api=line_api,
+        card=card,
+        processor=processor,
+        notion=notion,
+        handler=handler,
+    )
 
 
 class TestImageProcessingFlow:
@@ -32,40 +131,21 @@ class TestImageProcessingFlow:
         self.test_user_id = "U1234567890abcdef"
         self.test_message_id = "12345678901234567"
         self.test_reply_token = "test_reply_token_abc123"
-        
-        # 創建測試用的圖片數據
-        self.test_image_data = self._create_test_image()
-        
-        # 創建測試用的名片
-        self.test_card = BusinessCard(
-            name="張三",
-            company="測試公司",
-            title="工程師",
-            phone="02-1234-5678",
-            email="test@example.com",
-            confidence_score=0.95,
-            quality_score=0.9,
-            line_user_id=self.test_user_id
+
+    def _handle(self, env):
+        """以本類別的測試 ID 觸發圖片訊息處理"""
+        env.handler.handle_image_message(
+            self.test_user_id,
+            self.test_message_id,
+            self.test_reply_token
         )
 
-    def _create_test_image(self) -> bytes:
-        """創建測試用圖片"""
-        img = Image.new('RGB', (800, 600), color='white')
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        return buffer.getvalue()
-
-    @patch('src.namecard.api.line_bot.event_handler.submit_image_upload')
-    @patch('src.namecard.api.line_bot.event_handler.user_service')
-    @patch('src.namecard.api.line_bot.event_handler.security_service')
-    def test_complete_image_processing_flow_success(
-        self,
-        mock_security,
-        mock_user_service,
-        mock_submit_upload,
-    ):
+    @pytest.mark.parametrize("tenant_id", [None, "tenant_123"], ids=["single_tenant", "multi_tenant"])
+    # 注意：get_tenant_service 是在 handle_image_message 內部動態 import 的
+    @patch('src.namecard.core.services.tenant_service.get_tenant_service')
+    def test_complete_image_processing_flow_success(self, mock_get_service, handler_env, tenant_id):
         """
-        測試完整圖片處理流程 - 成功案例
+        測試完整圖片處理流程 - 成功案例（單租戶與多租戶）
         
         流程:
         1. 下載圖片 ✓
@@ -74,281 +154,99 @@ class TestImageProcessingFlow:
         4. Notion 儲存 ✓
         5. ImgBB 上傳提交 ✓
         """
-        # 設置 mocks
-        mock_security.is_user_blocked.return_value = False
-        mock_security.validate_image_data.return_value = True
-        
-        mock_status = Mock()
-        mock_status.daily_usage = 10
-        mock_status.is_batch_mode = False
-        mock_status.current_batch = None
-        mock_user_service.get_user_status.return_value = mock_status
+        handler_env.handler.tenant_id = tenant_id
         
-        # Mock LINE Bot API
-        mock_line_api = Mock()
-        mock_message_content = Mock()
-        mock_message_content.content = self.test_image_data
-        mock_line_api.get_message_content.return_value = mock_message_content
-        
-        # Mock Card Processor
-        mock_processor = Mock()
-        mock_processor.process_image.return_value = [self.test_card]
-        
-        # Mock Notion Client
-        mock_notion = Mock()
-        mock_notion.database_id = "test_db_id"
-        mock_notion.data_source_id = "test_ds_id"
-        mock_notion.save_business_card.return_value = ("page_123", "https://notion.so/page_123")
-        
-        # 創建 handler
-        handler = UnifiedEventHandler(
-            line_bot_api=mock_line_api,
-            card_processor=mock_processor,
-            notion_client=mock_notion,
-            tenant_id="test_tenant"
-        )
-        
-        # 執行
-        handler.handle_image_message(
-            self.test_user_id,
-            self.test_message_id,
-            self.test_reply_token
-        )
+        self._handle(handler_env)
         
         # 驗證流程
         # 1. 圖片下載
-        mock_line_api.get_message_content.assert_called_once_with(self.test_message_id)
+        handler_env.line_api.get_message_content.assert_called_once_with(self.test_message_id)
         
         # 2. 圖片驗證
-        mock_security.validate_image_data.assert_called_once_with(self.test_image_data)
+        handler_env.security.validate_image_data.assert_called_once_with(TEST_IMAGE_DATA)
         
         # 3. AI 處理
-        mock_processor.process_image.assert_called_once_with(
-            self.test_image_data,
+        handler_env.processor.process_image.assert_called_once_with(
+            TEST_IMAGE_DATA,
             self.test_user_id
         )
         
         # 4. Notion 儲存
-        mock_notion.save_business_card.assert_called_once_with(self.test_card)
+        handler_env.notion.save_business_card.assert_called_once()
+        assert handler_env.notion.save_business_card.call_args.args[0] is handler_env.card
         
         # 5. ImgBB 上傳提交
-        mock_submit_upload.assert_called_once()
-        call_kwargs = mock_submit_upload.call_args[1]
-        assert call_kwargs['image_data'] == self.test_image_data
+        handler_env.submit_upload.assert_called_once()
+        call_kwargs = handler_env.submit_upload.call_args[1]
+        assert call_kwargs['image_data'] == TEST_IMAGE_DATA
         assert call_kwargs['page_ids'] == ["page_123"]
         assert call_kwargs['user_id'] == self.test_user_id
 
-    @patch('src.namecard.api.line_bot.event_handler.submit_image_upload')
-    @patch('src.namecard.api.line_bot.event_handler.user_service')
-    @patch('src.namecard.api.line_bot.event_handler.security_service')
-    def test_imgbb_not_triggered_when_notion_fails(
-        self,
-        mock_security,
-        mock_user_service,
-        mock_submit_upload,
-    ):
-        """
-        測試當 Notion 儲存失敗時，ImgBB 上傳不應被觸發
-        
-        這是一個關鍵測試：
-        - Notion 返回 None (data_source_id 缺失等原因)
-        - success_count = 0
-        - ImgBB 上傳不應被調用
-        """
-        # 設置 mocks
-        mock_security.is_user_blocked.return_value = False
-        mock_security.validate_image_data.return_value = True
-        
-        mock_status = Mock()
-        mock_status.daily_usage = 10
-        mock_status.is_batch_mode = False
-        mock_status.current_batch = None
-        mock_user_service.get_user_status.return_value = mock_status
-        
-        # Mock LINE Bot API
-        mock_line_api = Mock()
-        mock_message_content = Mock()
-        mock_message_content.content = self.test_image_data
-        mock_line_api.get_message_content.return_value = mock_message_content
-        
-        # Mock Card Processor - 返回名片
-        mock_processor = Mock()
-        mock_processor.process_image.return_value = [self.test_card]
-        
-        # Mock Notion Client - 返回 None (模擬 data_source_id 缺失)
-        mock_notion = Mock()
-        mock_notion.database_id = "test_db_id"
-        mock_notion.data_source_id = None  # 關鍵：這會導致 save 返回 None
-        mock_notion.save_business_card.return_value = None  # 返回 None
-        
-        # 創建 handler
-        handler = UnifiedEventHandler(
-            line_bot_api=mock_line_api,
-            card_processor=mock_processor,
-            notion_client=mock_notion,
-            tenant_id="test_tenant"
-        )
-        
-        # 執行
-        handler.handle_image_message(
-            self.test_user_id,
-            self.test_message_id,
-            self.test_reply_token
-        )
-        
-        # 驗證 ImgBB 上傳未被調用
-        mock_submit_upload.assert_not_called()
-        
-        # 驗證 Notion 儲存被調用了
-        mock_notion.save_business_card.assert_called_once()
-
-    @patch('src.namecard.api.line_bot.event_handler.submit_image_upload')
-    @patch('src.namecard.api.line_bot.event_handler.user_service')
-    @patch('src.namecard.api.line_bot.event_handler.security_service')
-    def test_no_cards_detected(
-        self,
-        mock_security,
-        mock_user_service,
-        mock_submit_upload,
-    ):
-        """
-        測試 AI 未識別到名片的情況
-        """
-        # 設置 mocks
-        mock_security.is_user_blocked.return_value = False
-        mock_security.validate_image_data.return_value = True
-        
-        mock_status = Mock()
-        mock_status.daily_usage = 10
-        mock_status.is_batch_mode = False
-        mock_user_service.get_user_status.return_value = mock_status
-        
-        # Mock LINE Bot API
-        mock_line_api = Mock()
-        mock_message_content = Mock()
-        mock_message_content.content = self.test_image_data
-        mock_line_api.get_message_content.return_value = mock_message_content
-        
-        # Mock Card Processor - 拋出異常（未識別到名片）
-        from src.namecard.core.exceptions import EmptyAIResponseError
-        mock_processor = Mock()
-        mock_processor.process_image.side_effect = EmptyAIResponseError(
-            details={"reason": "no_cards_detected"}
-        )
-        
-        # Mock Notion Client
-        mock_notion = Mock()
-        
-        # 創建 handler
-        handler = UnifiedEventHandler(
-            line_bot_api=mock_line_api,
-            card_processor=mock_processor,
-            notion_client=mock_notion,
-            tenant_id="test_tenant"
-        )
+    @pytest.mark.parametrize("arrange,reached", [
+        pytest.param(
+            lambda env: setattr(env.security.is_user_blocked, "return_value", True),
+            (),
+            id="user_blocked",
+        ),
+        pytest.param(
+            lambda env: setattr(env.status, "daily_usage", 50),  # 達到限額
+            (),
+            id="daily_limit_exceeded",
+        ),
+        pytest.param(
+            lambda env: setattr(env.security.validate_image_data, "return_value", False),
+            ("download",),
+            id="invalid_image",
+        ),
+        pytest.param(
+            lambda env: setattr(
+                env.processor.process_image, "side_effect",
+                EmptyAIResponseError(details={"reason": "no_cards_detected"})
+            ),
+            ("download", "ai"),
+            id="no_cards_detected",
+        ),
+        # 關鍵：Notion 返回 None (data_source_id 缺失等原因) 時 success_count = 0，ImgBB 上傳不應被觸發
+        pytest.param(
+            lambda env: setattr(env.notion.save_business_card, "return_value", None),
+            ("download", "ai", "save"),
+            id="imgbb_not_triggered_when_notion_fails",
+        ),
+    ])
+    def test_flow_stops_at_failed_step(self, handler_env, arrange, reached):
+        """測試流程在失敗的步驟中止，後續步驟都不會被執行"""
+        arrange(handler_env)
         
         # 執行 - 不應拋出異常
-        handler.handle_image_message(
-            self.test_user_id,
-            self.test_message_id,
-            self.test_reply_token
-        )
-        
-        # 驗證 Notion 和 ImgBB 都未被調用
-        mock_notion.save_business_card.assert_not_called()
-        mock_submit_upload.assert_not_called()
-
-    @patch('src.namecard.api.line_bot.event_handler.user_service')
-    @patch('src.namecard.api.line_bot.event_handler.security_service')
-    def test_user_blocked(self, mock_security, mock_user_service):
-        """測試被封鎖用戶"""
-        mock_security.is_user_blocked.return_value = True
+        self._handle(handler_env)
         
-        mock_line_api = Mock()
-        mock_processor = Mock()
-        mock_notion = Mock()
-        
-        handler = UnifiedEventHandler(
-            line_bot_api=mock_line_api,
-            card_processor=mock_processor,
-            notion_client=mock_notion,
-        )
-        
-        handler.handle_image_message(
-            self.test_user_id,
-            self.test_message_id,
-            self.test_reply_token
-        )
-        
-        # 驗證未進行任何處理
-        mock_line_api.get_message_content.assert_not_called()
-        mock_processor.process_image.assert_not_called()
-        mock_notion.save_business_card.assert_not_called()
-
-    @patch('src.namecard.api.line_bot.event_handler.user_service')
-    @patch('src.namecard.api.line_bot.event_handler.security_service')
-    def test_daily_limit_exceeded(self, mock_security, mock_user_service):
-        """測試超過每日限額"""
-        mock_security.is_user_blocked.return_value = False
-        
-        mock_status = Mock()
-        mock_status.daily_usage = 50  # 達到限額
-        mock_user_service.get_user_status.return_value = mock_status
-        
-        mock_line_api = Mock()
-        mock_processor = Mock()
-        mock_notion = Mock()
-        
-        handler = UnifiedEventHandler(
-            line_bot_api=mock_line_api,
-            card_processor=mock_processor,
-            notion_client=mock_notion,
-        )
-        
-        handler.handle_image_message(
-            self.test_user_id,
-            self.test_message_id,
-            self.test_reply_token
-        )
-        
-        # 驗證未進行圖片處理
-        mock_line_api.get_message_content.assert_not_called()
-        mock_processor.process_image.assert_not_called()
-
-    @patch('src.namecard.api.line_bot.event_handler.user_service')
-    @patch('src.namecard.api.line_bot.event_handler.security_service')
-    def test_invalid_image(self, mock_security, mock_user_service):
-        """測試無效圖片"""
-        mock_security.is_user_blocked.return_value = False
-        mock_security.validate_image_data.return_value = False  # 圖片驗證失敗
-        
-        mock_status = Mock()
-        mock_status.daily_usage = 10
-        mock_user_service.get_user_status.return_value = mock_status
-        
-        mock_line_api = Mock()
-        mock_message_content = Mock()
-        mock_message_content.content = b'invalid image data'
-        mock_line_api.get_message_content.return_value = mock_message_content
-        
-        mock_processor = Mock()
-        mock_notion = Mock()
-        
-        handler = UnifiedEventHandler(
-            line_bot_api=mock_line_api,
-            card_processor=mock_processor,
-            notion_client=mock_notion,
-        )
-        
-        handler.handle_image_message(
-            self.test_user_id,
-            self.test_message_id,
-            self.test_reply_token
-        )
-        
-        # 驗證未進行 AI 處理
-        mock_processor.process_image.assert_not_called()
-        mock_notion.save_business_card.assert_not_called()
+        steps = {
+            "download": handler_env.line_api.get_message_content,
+            "ai": handler_env.processor.process_image,
+            "save": handler_env.notion.save_business_card,
+            "upload": handler_env.submit_upload,
+        }
+        for step, mock in steps.items():
+            assert mock.called == (step in reached), step
+
+    def test_multiple_cards_saved_with_partial_failure(self, handler_env):
+        """多張名片並行儲存，部分失敗時只上傳成功頁面，且順序與名片一致"""
+        cards = [CANONICAL_CARD.model_copy(update={"name": name}) for name in ("甲", "乙", "丙")]
+        handler_env.processor.process_image.return_value = cards
+
+        def save(card):
+            if card.name == "乙":
+                raise Exception("Notion API error")
+            return (f"page_{card.name}", f"https://notion.so/page_{card.name}")
+
+        handler_env.notion.save_business_card.side_effect = save
+
+        self._handle(handler_env)
+
+        assert handler_env.notion.save_business_card.call_count == 3
+        assert [card.processed for card in cards] == [True, False, True]
+        call_kwargs = handler_env.submit_upload.call_args[1]
+        assert call_kwargs['page_ids'] == ["page_甲", "page_丙"]
 
 
 class TestNotionDataSourceId:
@@ -360,13 +258,22 @@ class TestNotionDataSourceId:
     - 如果獲取失敗，save_business_card 返回 None
     """
 
-    @patch('src.namecard.infrastructure.storage.notion_client.Client')
-    @patch('src.namecard.infrastructure.storage.notion_client.settings')
-    def test_data_source_id_obtained_success(self, mock_settings, mock_client_class):
-        """測試成功獲取 data_source_id"""
+    @classmethod
+    def setup_class(cls):
+        """三個測試使用相同的 settings，整個類別只 patch 一次"""
+        cls._settings_patcher = patch('src.namecard.infrastructure.storage.notion_client.settings')
+        mock_settings = cls._settings_patcher.start()
         mock_settings.notion_api_key = "test_key"
         mock_settings.notion_database_id = "test_db_id"
-        
+
+    @classmethod
+    def teardown_class(cls):
+        """還原 settings"""
+        cls._settings_patcher.stop()
+
+    @patch('src.namecard.infrastructure.storage.notion_client.Client')
+    def test_data_source_id_obtained_success(self, mock_client_class):
+        """測試成功獲取 data_source_id"""
         mock_client = Mock()
         mock_client_class.return_value = mock_client
         
@@ -381,19 +288,14 @@ class TestNotionDataSourceId:
             "properties": {"Name": {"type": "title"}}
         }
         
-        from src.namecard.infrastructure.storage.notion_client import NotionClient
         client = NotionClient()
         
         assert client.data_source_id == "ds_123456"
         assert "Name" in client._db_schema
 
     @patch('src.namecard.infrastructure.storage.notion_client.Client')
-    @patch('src.namecard.infrastructure.storage.notion_client.settings')
-    def test_data_source_id_not_found(self, mock_settings, mock_client_class):
+    def test_data_source_id_not_found(self, mock_client_class):
         """測試 data_source_id 獲取失敗"""
-        mock_settings.notion_api_key = "test_key"
-        mock_settings.notion_database_id = "test_db_id"
-        
         mock_client = Mock()
         mock_client_class.return_value = mock_client
         
@@ -403,209 +305,59 @@ class TestNotionDataSourceId:
             "data_sources": []  # 空！
         }
         
-        from src.namecard.infrastructure.storage.notion_client import NotionClient
         client = NotionClient()
         
         # data_source_id 應該是 None
         assert client.data_source_id is None
 
     @patch('src.namecard.infrastructure.storage.notion_client.Client')
-    @patch('src.namecard.infrastructure.storage.notion_client.settings')
-    def test_save_returns_none_without_data_source_id(self, mock_settings, mock_client_class):
+    def test_save_returns_none_without_data_source_id(self, mock_client_class):
         """測試沒有 data_source_id 時 save 返回 None"""
-        mock_settings.notion_api_key = "test_key"
-        mock_settings.notion_database_id = "test_db_id"
-        
         mock_client = Mock()
         mock_client_class.return_value = mock_client
         
         # 模擬連接失敗
         mock_client.databases.retrieve.side_effect = Exception("Connection failed")
         
-        from src.namecard.infrastructure.storage.notion_client import NotionClient
         client = NotionClient()
         
         # data_source_id 應該是 None
         assert client.data_source_id is None
         
         # save 應該返回 None
-        card = BusinessCard(
-            name="Test",
-            line_user_id="test_user"
-        )
-        result = client.save_business_card(card)
+        result = client.save_business_card(CANONICAL_CARD)
         assert result is None
 
 
-class TestMultiTenantImageProcessing:
-    """多租戶圖片處理測試"""
-
-    @patch('src.namecard.api.line_bot.event_handler.submit_image_upload')
-    @patch('src.namecard.api.line_bot.event_handler.user_service')
-    @patch('src.namecard.api.line_bot.event_handler.security_service')
-    def test_tenant_usage_recorded(
-        self,
-        mock_security,
-        mock_user_service,
-        mock_submit_upload,
-    ):
-        """測試租戶使用記錄"""
-        # 設置 mocks
-        mock_security.is_user_blocked.return_value = False
-        mock_security.validate_image_data.return_value = True
-        
-        mock_status = Mock()
-        mock_status.daily_usage = 10
-        mock_status.is_batch_mode = False
-        mock_status.current_batch = None
-        mock_user_service.get_user_status.return_value = mock_status
-        
-        # 創建測試圖片
-        img = Image.new('RGB', (800, 600), color='white')
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        test_image = buffer.getvalue()
-        
-        # Mock LINE Bot API
-        mock_line_api = Mock()
-        mock_message_content = Mock()
-        mock_message_content.content = test_image
-        mock_line_api.get_message_content.return_value = mock_message_content
-        
-        # Mock Card Processor
-        test_card = BusinessCard(
-            name="Test",
-            phone="02-1234-5678",
-            confidence_score=0.9,
-            quality_score=0.9,
-            line_user_id="test_user"
-        )
-        mock_processor = Mock()
-        mock_processor.process_image.return_value = [test_card]
-        
-        # Mock Notion Client
-        mock_notion = Mock()
-        mock_notion.database_id = "test_db"
-        mock_notion.data_source_id = "test_ds"
-        mock_notion.save_business_card.return_value = ("page_123", "url")
-        
-        # 創建 handler with tenant_id
-        # 注意：get_tenant_service 是在 handle_image_message 內部動態 import 的
-        with patch('src.namecard.core.services.tenant_service.get_tenant_service') as mock_get_service:
-            mock_tenant_service = Mock()
-            mock_get_service.return_value = mock_tenant_service
-            
-            handler = UnifiedEventHandler(
-                line_bot_api=mock_line_api,
-                card_processor=mock_processor,
-                notion_client=mock_notion,
-                tenant_id="tenant_123"
-            )
-            
-            handler.handle_image_message(
-                "test_user_id",
-                "12345",
-                "reply_token"
-            )
-            
-            # 驗證租戶使用記錄被調用（可能因為內部 import 方式不同，這裡只驗證處理完成）
-            # 實際的租戶使用記錄測試需要更完整的集成測試
-            mock_notion.save_business_card.assert_called_once()
-
-
 class TestImageProcessingErrorHandling:
     """圖片處理錯誤處理測試"""
 
-    @patch('src.namecard.api.line_bot.event_handler.user_service')
-    @patch('src.namecard.api.line_bot.event_handler.security_service')
-    def test_line_api_error_handled(self, mock_security, mock_user_service):
+    def test_line_api_error_handled(self, handler_env):
         """測試 LINE API 錯誤處理"""
-        mock_security.is_user_blocked.return_value = False
-        
-        mock_status = Mock()
-        mock_status.daily_usage = 10
-        mock_user_service.get_user_status.return_value = mock_status
-        
-        # Mock LINE Bot API 拋出錯誤
-        from linebot.exceptions import LineBotApiError
-        mock_line_api = Mock()
-        
-        # LineBotApiError 需要正確的參數
-        mock_error = Mock()
-        mock_error.message = "Server error"
-        line_api_error = LineBotApiError(
-            status_code=500,
-            headers={},  # 添加必需的 headers 參數
-            request_id="req123",
-            error=mock_error
-        )
-        mock_line_api.get_message_content.side_effect = line_api_error
-        mock_line_api.push_message = Mock()  # 用於錯誤通知
-        
-        mock_processor = Mock()
-        mock_notion = Mock()
-        
-        handler = UnifiedEventHandler(
-            line_bot_api=mock_line_api,
-            card_processor=mock_processor,
-            notion_client=mock_notion,
-        )
+        handler_env.line_api.get_message_content.side_effect = LINE_API_SERVER_ERROR
         
         # 不應拋出異常
-        handler.handle_image_message(
+        handler_env.handler.handle_image_message(
             "test_user",
             "12345",
             "reply_token"
         )
         
         # 驗證嘗試發送錯誤通知
-        mock_line_api.push_message.assert_called()
+        handler_env.line_api.push_message.assert_called()
 
-    @patch('src.namecard.api.line_bot.event_handler.user_service')
-    @patch('src.namecard.api.line_bot.event_handler.security_service')
-    def test_ai_processing_error_handled(self, mock_security, mock_user_service):
+    def test_ai_processing_error_handled(self, handler_env):
         """測試 AI 處理錯誤處理"""
-        mock_security.is_user_blocked.return_value = False
-        mock_security.validate_image_data.return_value = True
-        
-        mock_status = Mock()
-        mock_status.daily_usage = 10
-        mock_status.is_batch_mode = False
-        mock_user_service.get_user_status.return_value = mock_status
-        
-        # 創建測試圖片
-        img = Image.new('RGB', (800, 600), color='white')
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        test_image = buffer.getvalue()
-        
-        mock_line_api = Mock()
-        mock_message_content = Mock()
-        mock_message_content.content = test_image
-        mock_line_api.get_message_content.return_value = mock_message_content
-        
-        # Mock Card Processor 拋出錯誤
-        from src.namecard.core.exceptions import APIQuotaExceededError
-        mock_processor = Mock()
-        mock_processor.process_image.side_effect = APIQuotaExceededError(
+        handler_env.processor.process_image.side_effect = APIQuotaExceededError(
             details={"reason": "quota_exceeded"}
         )
         
-        mock_notion = Mock()
-        
-        handler = UnifiedEventHandler(
-            line_bot_api=mock_line_api,
-            card_processor=mock_processor,
-            notion_client=mock_notion,
-        )
-        
         # 不應拋出異常
-        handler.handle_image_message(
+        handler_env.handler.handle_image_message(
             "test_user",
             "12345",
             "reply_token"
         )
         
         # 驗證發送錯誤回覆
-        mock_line_api.reply_message.assert_called()
-
+        handler_env.line_api.reply_message.assert_called()
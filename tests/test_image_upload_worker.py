@@ -4,29 +4,100 @@ ImageUploadWorker 測試
 測試圖片上傳 Queue 機制，確保：
 1. Worker 正確啟動和停止
 2. 任務正確提交和處理
-3. 多任務依序處理
+3. 多任務並行處理
 4. 錯誤處理正確
 """
 
 import pytest
+import hashlib
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock, call
 
 from src.namecard.infrastructure.storage.image_upload_worker import (
     ImageUploadWorker,
     ImageUploadTask,
+    UploadQueueFullError,
     get_upload_worker,
     submit_image_upload,
 )
 
+WORKER_MODULE = "src.namecard.infrastructure.storage.image_upload_worker"
+
+
+def page_updates(mock_notion):
+    """以集合返回 update_page_with_image 收到的 (page_id, url)，一次比對全部呼叫"""
+    return {c.args for c in mock_notion.update_page_with_image.call_args_list}
+
+
+@pytest.fixture(autouse=True)
+def recorded_failures(monkeypatch):
+    """攔截失敗任務記錄，避免測試連線 Redis"""
+    failures = []
+    monkeypatch.setattr(
+        f"{WORKER_MODULE}._record_failed_task_standalone",
+        lambda *args, **kwargs: failures.append(args),
+    )
+    return failures
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    """上傳重試不等待，避免測試被退避時間拖慢"""
+    monkeypatch.setattr(f"{WORKER_MODULE}.UPLOAD_RETRY_BASE_DELAY", 0)
+
+
+@pytest.fixture
+def mock_storage(monkeypatch):
+    """替換 get_image_storage 回傳的圖片儲存"""
+    storage = MagicMock()
+    monkeypatch.setattr(f"{WORKER_MODULE}.get_image_storage", lambda: storage)
+    return storage
+
+
+@pytest.fixture
+def mock_notion():
+    """模擬 NotionClient"""
+    return MagicMock()
+
+
+@pytest.fixture
+def make_task(mock_notion):
+    """建立測試任務：第 i 張圖片，對應 page_i_1 ... page_i_{pages}"""
+    def _make(i, pages=1, data=None):
+        return ImageUploadTask(
+            image_data=data or f"image_{i}".encode(),
+            page_ids=[f"page_{i}_{k}" for k in range(1, pages + 1)],
+            notion_client=mock_notion,
+            user_id=f"user_{i}",
+        )
+    return _make
+
+
+@pytest.fixture(scope="module")
+def shared_worker():
+    """整個模組共用一個 worker，避免每個測試重複建立/結束線程"""
+    worker = ImageUploadWorker()
+    worker.start()
+    yield worker
+    worker.stop()
+
+
+@pytest.fixture
+def worker(shared_worker, mock_storage, recorded_failures):
+    """共用 worker；測試結束時先等任務處理完，再還原 mock"""
+    yield shared_worker
+    shared_worker.wait_until_idle(timeout=5)
+    shared_worker._url_cache.clear()
+    shared_worker._storage = None  # 下個測試重新取得其 mock_storage
+
 
 class TestImageUploadTask:
     """ImageUploadTask 資料類別測試"""
 
-    def test_create_task(self):
+    def test_create_task(self, mock_notion):
         """應能創建任務"""
-        mock_notion = MagicMock()
         task = ImageUploadTask(
             image_data=b"test_image",
             page_ids=["page1", "page2"],
@@ -39,9 +110,24 @@ class TestImageUploadTask:
         assert task.notion_client == mock_notion
         assert task.user_id == "user123"
 
+    def test_task_hash_cached(self, mock_notion, monkeypatch):
+        """圖片雜湊應只計算一次"""
+        blake2b = MagicMock(wraps=hashlib.blake2b)
+        monkeypatch.setattr(hashlib, "blake2b", blake2b)
+        task = ImageUploadTask(
+            image_data=b"test_image",
+            page_ids=["page1"],
+            notion_client=mock_notion,
+            user_id="user123"
+        )
+        
+        assert task.data_hash() == task.data_hash()
+        assert len(task.data_hash()) == 16
+        assert blake2b.call_count == 1
+
 
-class TestImageUploadWorker:
-    """ImageUploadWorker 單元測試"""
+class TestImageUploadWorkerLifecycle:
+    """ImageUploadWorker 啟動/停止測試（使用獨立實例）"""
 
     def test_worker_starts_and_stops(self):
         """Worker 應能正確啟動和停止"""
@@ -53,10 +139,11 @@ class TestImageUploadWorker:
         assert worker._worker_thread is not None
         assert worker._worker_thread.is_alive()
         
-        # 停止
+        # 停止（stop 會等待線程結束）
+        thread = worker._worker_thread
         worker.stop()
-        time.sleep(0.5)  # 等待線程結束
         assert worker._running is False
+        assert not thread.is_alive()
 
     def test_worker_start_idempotent(self):
         """多次啟動應該只有一個線程"""
@@ -72,171 +159,209 @@ class TestImageUploadWorker:
         
         worker.stop()
 
-    @patch('src.namecard.infrastructure.storage.image_upload_worker.get_image_storage')
-    def test_submit_task(self, mock_get_storage):
-        """應能提交任務到隊列"""
-        mock_storage = MagicMock()
-        mock_storage.upload.return_value = None  # 模擬上傳失敗，避免複雜的 mock
-        mock_get_storage.return_value = mock_storage
-        
-        worker = ImageUploadWorker()
+
+    def test_stop_drains_submitted_tasks(self, mock_storage, mock_notion, make_task):
+        """stop 應先處理完已提交的任務，之後可再次啟動並處理新任務"""
+        mock_storage.upload.side_effect = lambda data: time.sleep(0.05) or "https://i.ibb.co/test.jpg"
+        mock_notion.update_page_with_image.return_value = True
+
+        worker = ImageUploadWorker(max_workers=1)
         worker.start()
-        
-        mock_notion = MagicMock()
-        task = ImageUploadTask(
-            image_data=b"test",
-            page_ids=["page1"],
-            notion_client=mock_notion,
-            user_id="user1"
-        )
-        
-        worker.submit(task)
-        
-        # 等待任務處理
-        time.sleep(0.5)
-        
+        for i in range(3):
+            worker.submit(make_task(i))
         worker.stop()
 
-    @patch('src.namecard.infrastructure.storage.image_upload_worker.get_image_storage')
-    def test_process_task_uploads_and_updates_pages(self, mock_get_storage):
+        assert mock_storage.upload.call_count == 3
+        assert worker.wait_until_idle(timeout=0)
+        assert len(worker._queue) == 0
+
+        # 重新啟動後，派發線程不應被殘留的哨兵立即結束
+        worker.start()
+        try:
+            worker.submit(make_task(3))
+            assert worker.wait_until_idle(timeout=2)
+            assert mock_storage.upload.call_count == 4
+        finally:
+            worker.stop()
+
+    def test_submit_during_stop_waits_for_stop(self, mock_storage, mock_notion, make_task):
+        """停止進行中提交任務時，應等 stop 完成後才啟動新的派發線程"""
+        mock_storage.upload.side_effect = lambda data: time.sleep(0.2) or "https://i.ibb.co/test.jpg"
+        mock_notion.update_page_with_image.return_value = True
+
+        worker = ImageUploadWorker(max_workers=1)
+        worker.submit(make_task(0))
+        old_thread = worker._worker_thread
+        stopper = threading.Thread(target=worker.stop)
+        stopper.start()
+        while worker._running:
+            time.sleep(0.01)
+
+        try:
+            worker.submit(make_task(1))
+            stopper.join(timeout=2)
+            assert not old_thread.is_alive()
+            assert worker._worker_thread is not old_thread
+            assert worker.wait_until_idle(timeout=2)
+            assert mock_storage.upload.call_count == 2
+        finally:
+            worker.stop()
+
+
+class TestImageUploadWorker:
+    """ImageUploadWorker 單元測試"""
+
+    def test_submit_task(self, worker, mock_storage, make_task):
+        """提交的任務應被處理，並以任務的圖片資料上傳"""
+        mock_storage.upload.return_value = "https://i.ibb.co/test.jpg"
+        task = make_task(1)
+
+        worker.submit(task)
+
+        assert worker.wait_until_idle(timeout=2)
+        mock_storage.upload.assert_called_once_with(task.image_data)
+
+    def test_process_task_uploads_and_updates_pages(self, worker, mock_storage, mock_notion, make_task):
         """任務處理應上傳圖片並更新 Notion 頁面"""
         # 設置 mock
-        mock_storage = MagicMock()
         mock_storage.upload.return_value = "https://i.ibb.co/test.jpg"
-        mock_get_storage.return_value = mock_storage
-        
-        mock_notion = MagicMock()
         mock_notion.update_page_with_image.return_value = True
         
-        worker = ImageUploadWorker()
-        worker.start()
-        
-        task = ImageUploadTask(
-            image_data=b"test_image_data",
-            page_ids=["page1", "page2", "page3"],
-            notion_client=mock_notion,
-            user_id="user123"
-        )
-        
-        worker.submit(task)
+        worker.submit(make_task(1, pages=3, data=b"test_image_data"))
         
         # 等待任務處理完成
-        time.sleep(1)
+        assert worker.wait_until_idle(timeout=2)
         
         # 驗證上傳被調用
         mock_storage.upload.assert_called_once_with(b"test_image_data")
         
         # 驗證每個頁面都被更新
         assert mock_notion.update_page_with_image.call_count == 3
-        mock_notion.update_page_with_image.assert_any_call("page1", "https://i.ibb.co/test.jpg")
-        mock_notion.update_page_with_image.assert_any_call("page2", "https://i.ibb.co/test.jpg")
-        mock_notion.update_page_with_image.assert_any_call("page3", "https://i.ibb.co/test.jpg")
-        
-        worker.stop()
+        assert page_updates(mock_notion) == {
+            ("page_1_1", "https://i.ibb.co/test.jpg"),
+            ("page_1_2", "https://i.ibb.co/test.jpg"),
+            ("page_1_3", "https://i.ibb.co/test.jpg"),
+        }
 
-    @patch('src.namecard.infrastructure.storage.image_upload_worker.get_image_storage')
-    def test_handles_upload_failure(self, mock_get_storage):
-        """上傳失敗時不應更新 Notion 頁面"""
-        mock_storage = MagicMock()
+    def test_handles_upload_failure(self, worker, mock_storage, mock_notion, make_task, recorded_failures):
+        """上傳重試仍失敗時不應更新 Notion 頁面，並記錄失敗任務"""
         mock_storage.upload.return_value = None  # 模擬上傳失敗
-        mock_get_storage.return_value = mock_storage
         
-        mock_notion = MagicMock()
+        worker.submit(make_task(1))
+        assert worker.wait_until_idle(timeout=2)
         
-        worker = ImageUploadWorker()
-        worker.start()
-        
-        task = ImageUploadTask(
-            image_data=b"test",
-            page_ids=["page1"],
-            notion_client=mock_notion,
-            user_id="user1"
-        )
-        
-        worker.submit(task)
-        time.sleep(0.5)
-        
-        # Notion 不應被調用
+        # 重試 3 次後放棄，Notion 不應被調用
+        assert mock_storage.upload.call_count == 3
         mock_notion.update_page_with_image.assert_not_called()
+        assert recorded_failures == [("user_1", ["page_1_1"], "ImgBB upload failed")]
+
+    def test_retry_succeeds_second_attempt(self, worker, mock_storage, mock_notion, make_task, recorded_failures):
+        """上傳第二次成功時應更新 Notion 頁面"""
+        mock_storage.upload.side_effect = [None, "https://i.ibb.co/retry.jpg"]
         
-        worker.stop()
+        worker.submit(make_task(1))
+        assert worker.wait_until_idle(timeout=2)
+        
+        assert mock_storage.upload.call_count == 2
+        mock_notion.update_page_with_image.assert_called_once_with("page_1_1", "https://i.ibb.co/retry.jpg")
+        assert recorded_failures == []
 
-    @patch('src.namecard.infrastructure.storage.image_upload_worker.get_image_storage')
-    def test_handles_notion_update_failure(self, mock_get_storage):
+    def test_handles_notion_update_failure(self, worker, mock_storage, mock_notion, make_task, recorded_failures):
         """Notion 更新失敗時應繼續處理其他頁面"""
-        mock_storage = MagicMock()
         mock_storage.upload.return_value = "https://i.ibb.co/test.jpg"
-        mock_get_storage.return_value = mock_storage
         
-        mock_notion = MagicMock()
-        # 第一個頁面失敗，其他成功
+        # 第一次更新失敗，其他成功（頁面並行更新，失敗的頁面不固定）
         mock_notion.update_page_with_image.side_effect = [
             Exception("API Error"),
             True,
             True
         ]
         
-        worker = ImageUploadWorker()
-        worker.start()
+        worker.submit(make_task(1, pages=3))
+        assert worker.wait_until_idle(timeout=2)
         
-        task = ImageUploadTask(
-            image_data=b"test",
-            page_ids=["page1", "page2", "page3"],
-            notion_client=mock_notion,
-            user_id="user1"
-        )
+        # 所有頁面都應該嘗試更新，只有失敗的頁面被記錄
+        assert mock_notion.update_page_with_image.call_count == 3
+        assert len(recorded_failures) == 1
+        assert len(recorded_failures[0][1]) == 1
+
+    def test_dedupes_identical_uploads(self, worker, mock_storage, mock_notion, make_task):
+        """相同圖片的多個任務應只上傳一次"""
+        mock_storage.upload.return_value = "https://i.ibb.co/same.jpg"
+        mock_notion.update_page_with_image.return_value = True
         
-        worker.submit(task)
-        time.sleep(1)
+        for i in range(3):
+            worker.submit(make_task(i, data=b"same_image"))
         
-        # 所有頁面都應該嘗試更新
-        assert mock_notion.update_page_with_image.call_count == 3
+        assert worker.wait_until_idle(timeout=2)
         
-        worker.stop()
+        assert mock_storage.upload.call_count == 1
+        assert mock_notion.update_page_with_image.call_count == 3
 
-    @patch('src.namecard.infrastructure.storage.image_upload_worker.get_image_storage')
-    def test_multiple_tasks_processed_sequentially(self, mock_get_storage):
-        """多個任務應依序處理"""
-        mock_storage = MagicMock()
-        mock_storage.upload.return_value = "https://i.ibb.co/test.jpg"
-        mock_get_storage.return_value = mock_storage
-        
-        mock_notion = MagicMock()
-        mock_notion.update_page_with_image.return_value = True
+    def test_submit_blocks_when_full(self, mock_storage, make_task):
+        """未完成任務達上限時，submit 應在逾時後拋出 UploadQueueFullError"""
+        release_upload = threading.Event()
+        # 上傳會卡住直到測試放行，讓任務維持在未完成狀態
+        def blocking_upload(data):
+            release_upload.wait(2)
+            return "https://i.ibb.co/test.jpg"
+        mock_storage.upload.side_effect = blocking_upload
+        
+        worker = ImageUploadWorker(max_inflight=2)
+        worker.start()
+        try:
+            worker.submit(make_task(0))
+            worker.submit(make_task(1))
+            with pytest.raises(UploadQueueFullError):
+                worker.submit(make_task(2), timeout=0.1)
+
+            # 任務完成後應釋出空位
+            release_upload.set()
+            assert worker.wait_until_idle(timeout=2)
+            worker.submit(make_task(2), timeout=0.1)
+        finally:
+            release_upload.set()
+            worker.stop()
+
+    def test_storage_resolved_once(self, monkeypatch, make_task):
+        """同一 worker 只應取得一次圖片儲存實例，stop 後重新取得"""
+        mock_get_storage = MagicMock()
+        mock_get_storage.return_value.upload.return_value = "https://i.ibb.co/test.jpg"
+        monkeypatch.setattr(f"{WORKER_MODULE}.get_image_storage", mock_get_storage)
         
         worker = ImageUploadWorker()
         worker.start()
-        
-        # 提交多個任務
         for i in range(5):
-            task = ImageUploadTask(
-                image_data=f"image_{i}".encode(),
-                page_ids=[f"page_{i}"],
-                notion_client=mock_notion,
-                user_id=f"user_{i}"
-            )
-            worker.submit(task)
-        
-        # 等待所有任務處理完成
-        time.sleep(2)
+            worker.submit(make_task(i))
+        assert worker.wait_until_idle(timeout=2)
+        worker.stop()
         
-        # 驗證所有上傳都被調用
-        assert mock_storage.upload.call_count == 5
+        assert mock_get_storage.call_count == 1
+        assert worker._storage is None
+
+    @pytest.mark.parametrize("page_count,expected_pools", [(1, 0), (3, 1)], ids=["single_page", "multi_page"])
+    def test_page_update_pool_only_for_multiple_pages(
+        self, worker, mock_storage, mock_notion, make_task, monkeypatch, page_count, expected_pools
+    ):
+        """單頁任務直接更新，不應為此建立線程池"""
+        mock_storage.upload.return_value = "https://i.ibb.co/test.jpg"
+        pool_factory = MagicMock(wraps=ThreadPoolExecutor)
+        monkeypatch.setattr(f"{WORKER_MODULE}.ThreadPoolExecutor", pool_factory)
         
-        # 驗證所有頁面都被更新
-        assert mock_notion.update_page_with_image.call_count == 5
+        worker.submit(make_task(1, pages=page_count))
+        assert worker.wait_until_idle(timeout=2)
         
-        worker.stop()
+        assert mock_notion.update_page_with_image.call_count == page_count
+        assert pool_factory.call_count == expected_pools
 
 
 class TestGetUploadWorker:
     """get_upload_worker 函數測試"""
 
-    def test_returns_singleton(self):
+    def test_returns_singleton(self, monkeypatch):
         """應返回單例 worker"""
-        # 重置全域狀態
-        import src.namecard.infrastructure.storage.image_upload_worker as module
-        module._worker = None
+        # 重置全域狀態（測試結束後由 monkeypatch 還原）
+        monkeypatch.setattr(f"{WORKER_MODULE}._worker", None)
         
         worker1 = get_upload_worker()
         worker2 = get_upload_worker()
@@ -249,104 +374,64 @@ class TestGetUploadWorker:
 class TestSubmitImageUpload:
     """submit_image_upload 便捷函數測試"""
 
-    @patch('src.namecard.infrastructure.storage.image_upload_worker.get_upload_worker')
-    def test_submits_task_to_worker(self, mock_get_worker):
-        """應提交任務到 worker"""
-        mock_worker = MagicMock()
-        mock_get_worker.return_value = mock_worker
-        
-        mock_notion = MagicMock()
-        
+    @patch(f'{WORKER_MODULE}._sync_upload_image')
+    @patch(f'{WORKER_MODULE}._is_rq_available', return_value=False)
+    def test_sync_upload_when_rq_unavailable(self, mock_rq_available, mock_sync, mock_notion):
+        """RQ 不可用時應同步上傳"""
         submit_image_upload(
             image_data=b"test_image",
             page_ids=["page1", "page2"],
             notion_client=mock_notion,
             user_id="user123"
         )
-        
-        # 驗證 submit 被調用
-        mock_worker.submit.assert_called_once()
-        
-        # 驗證任務內容
-        submitted_task = mock_worker.submit.call_args[0][0]
-        assert submitted_task.image_data == b"test_image"
-        assert submitted_task.page_ids == ["page1", "page2"]
-        assert submitted_task.user_id == "user123"
+
+        mock_sync.assert_called_once_with(b"test_image", ["page1", "page2"], mock_notion, "user123")
 
 
 class TestBatchUploadScenario:
     """批量上傳場景測試 (10-30 張圖片)"""
 
-    @patch('src.namecard.infrastructure.storage.image_upload_worker.get_image_storage')
-    def test_handles_30_images_batch(self, mock_get_storage):
-        """應能處理 30 張圖片的批次上傳"""
-        mock_storage = MagicMock()
+    @pytest.mark.parametrize("num_images,pages", [(5, 1), (30, 2)], ids=["5_images", "30_images_2_pages"])
+    def test_handles_batch(self, worker, mock_storage, mock_notion, make_task, num_images, pages):
+        """批次中的每張圖片都應被上傳，每個頁面都應被更新（並行處理，不保證順序）"""
         mock_storage.upload.return_value = "https://i.ibb.co/batch.jpg"
-        mock_get_storage.return_value = mock_storage
-        
-        mock_notion = MagicMock()
         mock_notion.update_page_with_image.return_value = True
         
-        worker = ImageUploadWorker()
-        worker.start()
-        
-        # 模擬 30 張圖片上傳（每張圖片對應一個任務）
-        num_images = 30
+        # 每張圖片對應一個任務
         for i in range(num_images):
-            task = ImageUploadTask(
-                image_data=f"image_data_{i}".encode(),
-                page_ids=[f"page_{i}_1", f"page_{i}_2"],  # 每張圖片對應 2 個頁面
-                notion_client=mock_notion,
-                user_id=f"user_{i}"
-            )
-            worker.submit(task)
+            worker.submit(make_task(i, pages=pages))
         
-        # 等待所有任務處理（給足夠時間）
-        timeout = 10  # 10 秒超時
-        start = time.time()
-        while worker._queue.qsize() > 0 and (time.time() - start) < timeout:
-            time.sleep(0.1)
+        # 等待所有任務處理（線程池並行處理，應遠快於逐一處理）
+        assert worker.wait_until_idle(timeout=1)
         
         # 驗證所有圖片都被上傳
         assert mock_storage.upload.call_count == num_images
         
-        # 驗證所有頁面都被更新（30 張圖片 x 2 頁面 = 60 次更新）
-        assert mock_notion.update_page_with_image.call_count == num_images * 2
-        
-        worker.stop()
+        # 驗證所有頁面都被更新
+        assert mock_notion.update_page_with_image.call_count == num_images * pages
+        assert page_updates(mock_notion) == {
+            (f"page_{i}_{k}", "https://i.ibb.co/batch.jpg")
+            for i in range(num_images)
+            for k in range(1, pages + 1)
+        }
 
-    @patch('src.namecard.infrastructure.storage.image_upload_worker.get_image_storage')
-    def test_queue_does_not_block_main_thread(self, mock_get_storage):
+    def test_queue_does_not_block_main_thread(self, worker, mock_storage, make_task):
         """Queue 不應阻塞主線程"""
-        mock_storage = MagicMock()
         # 模擬慢速上傳
         def slow_upload(data):
             time.sleep(0.1)
             return "https://i.ibb.co/slow.jpg"
         mock_storage.upload.side_effect = slow_upload
-        mock_get_storage.return_value = mock_storage
         
-        mock_notion = MagicMock()
-        
-        worker = ImageUploadWorker()
-        worker.start()
+        tasks = [make_task(i) for i in range(10)]
         
         # 記錄開始時間
         start = time.time()
         
         # 快速提交 10 個任務
-        for i in range(10):
-            task = ImageUploadTask(
-                image_data=f"image_{i}".encode(),
-                page_ids=[f"page_{i}"],
-                notion_client=mock_notion,
-                user_id=f"user_{i}"
-            )
+        for task in tasks:
             worker.submit(task)
         
         # 提交應該非常快（不阻塞）
         submit_time = time.time() - start
         assert submit_time < 0.5, f"Submit took too long: {submit_time}s"
-        
-        worker.stop()
-
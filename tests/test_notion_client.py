@@ -1,20 +1,112 @@
 """Notion 客戶端測試"""
 
+import copy
+import threading
+import time
+
+import httpx
 import pytest
-from unittest.mock import Mock, patch, MagicMock
+from unittest.mock import ANY, Mock, patch, MagicMock
 from datetime import datetime
-from src.namecard.infrastructure.storage.notion_client import NotionClient
+from notion_client import APIResponseError
+from src.namecard.infrastructure.storage.notion_client import (
+    MAX_CONCURRENT_NOTION_REQUESTS,
+    NOTION_RATE_LIMIT_MAX_ATTEMPTS,
+    NotionClient,
+    _call_notion_api,
+)
 from src.namecard.core.models.card import BusinessCard
 
 
+TEST_USER_ID = "test_user_123"
+
+
+def _property_value(prop):
+    """取出 Notion 屬性的實際值（title/rich_text 取文字內容）"""
+    for kind in ("title", "rich_text"):
+        if kind in prop:
+            return prop[kind][0]["text"]["content"]
+    if "select" in prop:
+        return prop["select"]["name"]
+    for kind in ("phone_number", "email", "url", "number"):
+        if kind in prop:
+            return prop[kind]
+    return prop
+
+
+# (名片, 應有屬性 -> 值（ANY 表示只檢查存在）, 不應出現的屬性)
+# 屬性名稱對應 NotionFields；網站、LINE ID、傳真等額外資訊合併寫入「備註」
+CARD_PROPERTY_CASES = [
+    pytest.param(
+        BusinessCard(
+            name="張三",
+            company="測試公司",
+            title="工程師",
+            phone="02-1234-5678",
+            email="test@example.com",
+            address="台北市信義區",
+            website="https://example.com",
+            fax="02-8765-4321",
+            line_id="test_line_id",
+            confidence_score=0.95,
+            quality_score=0.9,
+            line_user_id=TEST_USER_ID
+        ),
+        {
+            "Name": "張三",
+            "公司名稱": "測試公司",
+            "職稱": "工程師",
+            "電話": "+886212345678",
+            "Email": "test@example.com",
+            "地址": "台北市信義區",
+            "備註": "網站: https://example.com | LINE ID: test_line_id | 傳真: +886287654321",
+        },
+        ("部門",),
+        id="complete_card",
+    ),
+    pytest.param(
+        BusinessCard(name="簡單名片", confidence_score=0.8, quality_score=0.7, line_user_id=TEST_USER_ID),
+        {"Name": "簡單名片"},
+        ("公司名稱", "電話", "Email", "備註"),
+        id="minimal_card",
+    ),
+    # 網站以原始格式寫入備註，不補上協議
+    pytest.param(
+        BusinessCard(name="測試", website="example.com", line_user_id=TEST_USER_ID),
+        {"備註": "網站: example.com"}, (),
+        id="website_without_protocol",
+    ),
+    pytest.param(
+        BusinessCard(name="測試", website="http://example.com", line_user_id=TEST_USER_ID),
+        {"備註": "網站: http://example.com"}, (),
+        id="website_with_protocol",
+    ),
+    # 公司名稱只取第一段作為主公司名稱
+    pytest.param(
+        BusinessCard(name="測試", company="測試公司 台北分公司", line_user_id=TEST_USER_ID),
+        {"公司名稱": "測試公司"}, (),
+        id="main_company_name",
+    ),
+]
+
+
+@pytest.fixture(scope="module")
+def notion_client_template():
+    """只建立一次的 NotionClient（Client 已 mock），各測試以淺複製取用"""
+    with patch('src.namecard.infrastructure.storage.notion_client.Client'):
+        return NotionClient()
+
+
 class TestNotionClient:
     """NotionClient 測試"""
-    
-    def setup_method(self):
-        """每個測試方法前的設置"""
-        with patch('src.namecard.infrastructure.storage.notion_client.Client'):
-            self.client = NotionClient()
-        self.test_user_id = "test_user_123"
+
+    test_user_id = TEST_USER_ID
+
+    @pytest.fixture(autouse=True)
+    def _client(self, notion_client_template):
+        """每個測試取得模板的淺複製，並換上全新的 Notion API mock"""
+        self.client = copy.copy(notion_client_template)
+        self.client.client = MagicMock()
     
     @patch('src.namecard.infrastructure.storage.notion_client.Client')
     def test_init_success(self, mock_client_class):
@@ -32,96 +124,17 @@ class TestNotionClient:
             mock_client_class.assert_called_with(auth="test_key")
             assert client.database_id == "test_db_id"
     
-    def test_prepare_card_properties_complete_card(self):
-        """測試準備完整名片屬性"""
-        card = BusinessCard(
-            name="張三",
-            company="測試公司",
-            title="工程師",
-            phone="02-1234-5678",
-            email="test@example.com",
-            address="台北市信義區",
-            website="https://example.com",
-            fax="02-8765-4321",
-            line_id="test_line_id",
-            confidence_score=0.95,
-            quality_score=0.9,
-            line_user_id=self.test_user_id
-        )
-        
-        properties = self.client._prepare_card_properties(card)
-        
-        # 檢查所有屬性都正確設置
-        assert properties["姓名"]["title"][0]["text"]["content"] == "張三"
-        assert properties["公司"]["rich_text"][0]["text"]["content"] == "測試公司"
-        assert properties["職稱"]["rich_text"][0]["text"]["content"] == "工程師"
-        assert properties["電話"]["phone_number"] == "02-1234-5678"
-        assert properties["Email"]["email"] == "test@example.com"
-        assert properties["地址"]["rich_text"][0]["text"]["content"] == "台北市信義區"
-        assert properties["網站"]["url"] == "https://example.com"
-        assert properties["傳真"]["rich_text"][0]["text"]["content"] == "02-8765-4321"
-        assert properties["LINE ID"]["rich_text"][0]["text"]["content"] == "test_line_id"
-        assert properties["信心度"]["number"] == 0.95
-        assert properties["品質評分"]["number"] == 0.9
-        assert properties["LINE用戶"]["rich_text"][0]["text"]["content"] == self.test_user_id
-        assert properties["狀態"]["select"]["name"] == "待處理"
-    
-    def test_prepare_card_properties_minimal_card(self):
-        """測試準備最小名片屬性"""
-        card = BusinessCard(
-            name="簡單名片",
-            confidence_score=0.8,
-            quality_score=0.7,
-            line_user_id=self.test_user_id
-        )
-        
+    @pytest.mark.parametrize("card,expected,absent", CARD_PROPERTY_CASES)
+    def test_prepare_card_properties(self, card, expected, absent):
+        """測試準備名片屬性：檢查應有的屬性值，以及空值屬性不應出現"""
         properties = self.client._prepare_card_properties(card)
         
-        # 只應該包含有值的屬性
-        assert "姓名" in properties
-        assert "信心度" in properties
-        assert "品質評分" in properties
-        assert "LINE用戶" in properties
-        assert "狀態" in properties
-        assert "建立時間" in properties
-        
-        # 不應該包含空值屬性
-        assert "公司" not in properties
-        assert "電話" not in properties
-        assert "Email" not in properties
-    
-    def test_prepare_card_properties_website_protocol(self):
-        """測試網站 URL 協議處理"""
-        # 測試沒有協議的網站
-        card = BusinessCard(
-            name="測試",
-            website="example.com",
-            line_user_id=self.test_user_id
-        )
-        
-        properties = self.client._prepare_card_properties(card)
-        assert properties["網站"]["url"] == "https://example.com"
-        
-        # 測試已有協議的網站
-        card.website = "http://example.com"
-        properties = self.client._prepare_card_properties(card)
-        assert properties["網站"]["url"] == "http://example.com"
-    
-    def test_prepare_card_properties_processed_status(self):
-        """測試處理狀態設置"""
-        # 測試未處理狀態
-        card = BusinessCard(
-            name="測試",
-            processed=False,
-            line_user_id=self.test_user_id
-        )
-        properties = self.client._prepare_card_properties(card)
-        assert properties["狀態"]["select"]["name"] == "待處理"
-        
-        # 測試已處理狀態
-        card.processed = True
-        properties = self.client._prepare_card_properties(card)
-        assert properties["狀態"]["select"]["name"] == "已處理"
+        for key, value in expected.items():
+            assert key in properties
+            if value is not ANY:
+                assert _property_value(properties[key]) == value, key
+        for key in absent:
+            assert key not in properties
     
     @patch.object(NotionClient, '_prepare_card_properties')
     def test_save_business_card_success(self, mock_prepare):
@@ -311,4 +324,68 @@ class TestNotionClient:
                 client = NotionClient()
                 
                 expected_url = "https://notion.so/123456781234123412341234567890abc"
-                assert client.database_url == expected_url
\ No newline at end of file
+                assert client.database_url == expected_url
+
+
+def _api_error(status, headers=None):
+    """建立 Notion API 錯誤（不經建構子，避免依賴 notion-client 版本的參數）"""
+    error = APIResponseError.__new__(APIResponseError)
+    error.status = status
+    error.headers = httpx.Headers(headers or {})
+    return error
+
+
+class TestCallNotionApi:
+    """Notion API 共用並行名額與限流重試測試"""
+
+    @patch('src.namecard.infrastructure.storage.notion_client.time.sleep')
+    def test_retries_after_rate_limit(self, mock_sleep):
+        """被限流時應依 Retry-After 等待後重試"""
+        api = Mock(side_effect=[_api_error(429, {"retry-after": "2"}), "ok"])
+
+        assert _call_notion_api(api, block_id="page_1") == "ok"
+        assert api.call_count == 2
+        mock_sleep.assert_called_once_with(2.0)
+
+    @patch('src.namecard.infrastructure.storage.notion_client.time.sleep')
+    def test_raises_when_rate_limit_persists(self, mock_sleep):
+        """重試次數用盡仍被限流時應拋出原例外，未帶 Retry-After 時指數退避"""
+        api = Mock(side_effect=_api_error(429))
+
+        with pytest.raises(APIResponseError):
+            _call_notion_api(api)
+        assert api.call_count == NOTION_RATE_LIMIT_MAX_ATTEMPTS
+        assert [c.args[0] for c in mock_sleep.call_args_list] == [1.0, 2.0]
+
+    @patch('src.namecard.infrastructure.storage.notion_client.time.sleep')
+    def test_other_errors_not_retried(self, mock_sleep):
+        """非限流錯誤不應重試"""
+        api = Mock(side_effect=_api_error(400))
+
+        with pytest.raises(APIResponseError):
+            _call_notion_api(api)
+        api.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    def test_concurrent_calls_share_limit(self):
+        """多個線程同時呼叫時，同時進行的請求數不應超過上限"""
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def api():
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.05)
+            with lock:
+                active -= 1
+
+        threads = [threading.Thread(target=_call_notion_api, args=(api,)) for _ in range(MAX_CONCURRENT_NOTION_REQUESTS * 3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert peak == MAX_CONCURRENT_NOTION_REQUESTS
@@ -0,0 +1,175 @@
+"""
+Webhook 處理測試
+
+確保 /callback 驗證後立即回應，事件由背景線程處理，
+以及 webhook body 的解析與事件分派
+"""
+
+import json
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import src.namecard.api.line_bot.main as main
+
+MAIN_MODULE = "src.namecard.api.line_bot.main"
+
+WEBHOOK_BODY = json.dumps({
+    "events": [
+        {
+            "type": "message",
+            "message": {"type": "text", "text": "help"},
+            "source": {"userId": "test_user"},
+            "replyToken": "test_reply_token"
+        }
+    ]
+})
+
+
+@pytest.fixture(autouse=True)
+def drain_events():
+    """每個測試結束後等待背景事件處理完畢，避免狀態外洩到其他測試"""
+    yield
+    main.wait_for_pending_events(timeout=2)
+
+
+@pytest.fixture
+def dev_settings(monkeypatch):
+    """開發環境設定（跳過簽名驗證，走預設模式）"""
+    monkeypatch.setattr(f"{MAIN_MODULE}.settings.flask_env", "development")
+    monkeypatch.setattr(f"{MAIN_MODULE}.settings.line_channel_secret", "test_secret")
+    monkeypatch.setattr(f"{MAIN_MODULE}.settings.line_channel_access_token", "test_token")
+    monkeypatch.setattr(f"{MAIN_MODULE}.default_event_handler", object())
+
+
+def _event(message, event_type="message", user_id="test_user", reply_token="test_reply_token"):
+    """建立單一事件的 webhook body"""
+    return json.dumps({"events": [{
+        "type": event_type,
+        "message": message,
+        "source": {"userId": user_id},
+        "replyToken": reply_token,
+    }]})
+
+
+class TestEventProcessingPool:
+    """webhook 回應與背景事件處理測試"""
+
+    def test_callback_returns_before_processing(self, client, dev_settings, monkeypatch):
+        """webhook 應在事件處理完成前就回應 200"""
+        release = threading.Event()
+        processed = threading.Event()
+
+        def slow_process(body):
+            release.wait(2)
+            processed.set()
+
+        monkeypatch.setattr(f"{MAIN_MODULE}.process_events_manually", slow_process)
+
+        start = time.time()
+        response = client.post('/callback', data=WEBHOOK_BODY,
+                               headers={'X-Line-Signature': 'test_signature'})
+        elapsed = time.time() - start
+
+        assert response.status_code == 200
+        assert response.data.decode() == 'OK'
+        assert elapsed < 1
+        assert not processed.is_set()
+
+        # 放行後背景線程應完成處理
+        release.set()
+        assert processed.wait(2)
+
+    def test_background_error_does_not_stop_worker(self):
+        """背景處理拋出例外後，後續事件仍應被處理"""
+        processed = threading.Event()
+
+        def failing_process():
+            raise RuntimeError("boom")
+
+        main.enqueue_event_processing(failing_process)
+        main.enqueue_event_processing(processed.set)
+
+        assert processed.wait(2)
+
+    def test_events_processed_concurrently(self):
+        """多個 worker 應能同時處理事件，慢事件不會卡住後續事件"""
+        release = threading.Event()
+        processed = threading.Event()
+
+        main.enqueue_event_processing(release.wait, 2)
+        main.enqueue_event_processing(processed.set)
+
+        # 第一個事件仍在等待時，第二個事件應已處理完成
+        assert processed.wait(1)
+        release.set()
+
+    def test_full_backlog_processes_inline(self, monkeypatch):
+        """待處理事件已滿時，應直接在請求線程中處理（背壓）"""
+        monkeypatch.setattr(main, "_events_slots", threading.BoundedSemaphore(1))
+        release = threading.Event()
+        caller = []
+
+        main.enqueue_event_processing(release.wait, 2)
+        main.enqueue_event_processing(lambda: caller.append(threading.current_thread()))
+
+        assert caller == [threading.current_thread()]
+        release.set()
+        assert main.wait_for_pending_events(timeout=2)
+
+
+class TestWebhookBodyParsing:
+    """webhook body 解析與事件分派測試"""
+
+    def test_webhook_body_parsed(self):
+        """webhook body 解析後，destination 與事件內容（含中文）應正確傳到處理流程"""
+        body = json.dumps({
+            "destination": "U123",
+            "events": [{
+                "type": "message",
+                "message": {"type": "text", "text": "名片 說明"},
+                "source": {"userId": "test_user"},
+                "replyToken": "test_reply_token",
+            }],
+        }, ensure_ascii=False)
+        event_handler = Mock()
+
+        assert main.extract_channel_id(body) == "U123"
+        main.process_events_with_handler(body, event_handler)
+
+        event_handler.handle_text_message.assert_called_once_with("test_user", "名片 說明", "test_reply_token")
+
+    def test_invalid_webhook_json_is_handled(self):
+        """無效 JSON 不應拋出例外，也不應呼叫事件處理器"""
+        event_handler = Mock()
+
+        assert main.extract_channel_id("not json") is None
+        main.process_events_with_handler("not json", event_handler)
+
+        event_handler.handle_text_message.assert_not_called()
+        event_handler.handle_image_message.assert_not_called()
+
+    @pytest.mark.parametrize("body,expected_method,expected_args", [
+        (_event({"type": "text", "text": " hello "}),
+         "handle_text_message", ("test_user", "hello", "test_reply_token")),
+        (_event({"type": "image", "id": "msg_1"}),
+         "handle_image_message", ("test_user", "msg_1", "test_reply_token")),
+        (_event({"type": "sticker"}), None, None),
+        (_event({"type": "text", "text": "hi"}, event_type="follow"), None, None),
+        (_event({"type": "text", "text": "hi"}, user_id=None), None, None),
+        (_event({"type": "text", "text": "hi"}, reply_token=None), None, None),
+    ], ids=["text", "image", "unsupported_type", "non_message", "missing_user_id", "missing_reply_token"])
+    def test_events_dispatched_by_message_type(self, body, expected_method, expected_args):
+        """事件應依訊息類型分派到對應的處理方法，無法處理的事件直接略過"""
+        event_handler = Mock()
+
+        main.process_events_with_handler(body, event_handler)
+
+        for method in ("handle_text_message", "handle_image_message"):
+            mock = getattr(event_handler, method)
+            if method == expected_method:
+                mock.assert_called_once_with(*expected_args)
+            else:
+                mock.assert_not_called()